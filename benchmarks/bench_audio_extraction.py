@@ -0,0 +1,86 @@
+
+# benchmarks/bench_audio_extraction.py
+#
+# Compares the old WAV round-trip (moviepy -> 44.1 kHz WAV -> read back) with
+# piping 16 kHz PCM straight from ffmpeg. Each path runs in its own process so
+# peak RSS and disk writes are measured separately.
+#
+#     python -m benchmarks.bench_audio_extraction --minutes 60
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import imageio_ffmpeg
+
+
+def make_video(path, minutes):
+    subprocess.run([imageio_ffmpeg.get_ffmpeg_exe(), '-y', '-loglevel', 'error',
+                    '-f', 'lavfi', '-i', 'color=size=64x64:rate=1',
+                    '-f', 'lavfi', '-i', 'sine=frequency=220:sample_rate=44100',
+                    '-t', str(minutes * 60), '-shortest', '-c:v', 'libx264', '-c:a', 'aac', path],
+                   check=True)
+
+
+def written_bytes():
+    """Bytes this process and its waited-for children caused to be written to storage."""
+    try:
+        with open('/proc/self/io') as io:
+            return dict(line.split(': ') for line in io.read().splitlines()).get('write_bytes', '0')
+    except OSError:
+        return '0'
+
+
+def run_path(path, video):
+    start = time.perf_counter()
+    if path == 'wav':
+        # The original pipeline: 44.1 kHz WAV next to the video, read back whole
+        from moviepy.editor import VideoFileClip
+        clip = VideoFileClip(video)
+        audio_file_path = video.rsplit('.', 1)[0] + '.wav'
+        clip.audio.write_audiofile(audio_file_path, codec='pcm_s16le', ffmpeg_params=["-ac", "1"], logger=None)
+        with open(audio_file_path, 'rb') as audio_file:
+            content = audio_file.read()
+        audio_bytes = len(content)
+        disk_bytes = os.path.getsize(audio_file_path)
+    else:
+        from video_to_audio_to_text import extract_pcm
+        samples, _ = extract_pcm(video)
+        audio_bytes = samples.nbytes
+        disk_bytes = 0
+    seconds = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(json.dumps({'path': path, 'seconds': seconds, 'audio_bytes': audio_bytes,
+                      'disk_bytes': disk_bytes, 'io_write_bytes': int(written_bytes()),
+                      'peak_rss_bytes': peak_rss}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audio extraction disk and memory benchmark")
+    parser.add_argument("--minutes", type=int, default=60)
+    parser.add_argument("--run", nargs=2, metavar=("PATH", "VIDEO"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_path(*args.run)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        video = os.path.join(tmp, 'lecture.mp4')
+        make_video(video, args.minutes)
+        print(f"{'path':>5} {'seconds':>8} {'disk MB':>8} {'peak RSS MB':>12}")
+        for path in ('wav', 'pipe'):
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_audio_extraction',
+                                     '--run', path, video], check=True, capture_output=True, text=True)
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            print(f"{path:>5} {result['seconds']:>8.1f} {result['disk_bytes'] / 2 ** 20:>8.0f} "
+                  f"{result['peak_rss_bytes'] / 2 ** 20:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
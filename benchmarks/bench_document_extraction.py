@@ -0,0 +1,93 @@
+
+# benchmarks/bench_document_extraction.py
+#
+# Throughput and peak memory of PDF text extraction on a generated document:
+# the old page-by-page string concatenation against streaming pages, on one
+# process and across worker processes. Each mode runs in its own process so
+# peak RSS is measured separately (workers' peak is reported alongside).
+#
+#     python -m benchmarks.bench_document_extraction --pages 1000 --workers 1 2 4
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+WORDS = (
+    "the lecture covers photosynthesis cellular respiration supply demand elasticity "
+    "markets prices empires trade routes revolutions equations proofs theorems"
+).split()
+
+
+def make_pdf(path, pages, seed=0):
+    """Writes a PDF of ``pages`` pages of wrapped random text, about 3 KB each."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        text = " ".join(rng.choices(WORDS, k=450))
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def run_mode(mode, path, workers):
+    from document_extraction import iter_pdf_pages
+
+    start = time.perf_counter()
+    pages = chars = 0
+    if mode == 'concat':
+        # The original extract_text_from_pdf
+        text = ""
+        with fitz.open(path) as doc:
+            for page in doc:
+                text += page.get_text()
+                pages += 1
+        chars = len(text)
+    else:
+        # Consume pages as they come, the way StreamingAnalysis does
+        for page_text in iter_pdf_pages(path, workers=workers):
+            pages += 1
+            chars += len(page_text)
+    seconds = time.perf_counter() - start
+    print(json.dumps({'mode': mode, 'workers': workers, 'pages': pages, 'chars': chars, 'seconds': seconds,
+                      'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                      'worker_peak_rss_bytes': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF extraction throughput and memory benchmark")
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--run", nargs=3, metavar=("MODE", "PDF", "WORKERS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        mode, path, workers = args.run
+        run_mode(mode, path, int(workers))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'book.pdf')
+        make_pdf(path, args.pages)
+        print(f"{args.pages} pages, {os.path.getsize(path) / 2 ** 20:.1f} MB")
+        print(f"{'mode':>7} {'workers':>8} {'seconds':>8} {'pages/s':>8} {'peak RSS MB':>12} {'worker RSS MB':>14}")
+        runs = [('concat', 1)] + [('stream', workers) for workers in args.workers]
+        for mode, workers in runs:
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_document_extraction',
+                                     '--run', mode, path, str(workers)],
+                                    check=True, capture_output=True, text=True)
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            print(f"{mode:>7} {workers:>8} {result['seconds']:>8.2f} {result['pages'] / result['seconds']:>8.0f} "
+                  f"{result['peak_rss_bytes'] / 2 ** 20:>12.0f} {result['worker_peak_rss_bytes'] / 2 ** 20:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+
+# benchmarks/bench_hierarchical_summary.py
+#
+# Stage timings of hierarchical (map-reduce) summarization on a generated
+# book-length text for different numbers of section workers.
+#
+#     python -m benchmarks.bench_hierarchical_summary --chars 5000000 --workers 1 2 4
+
+import argparse
+import random
+import resource
+
+from text_summarization import hierarchical_summarize
+
+SENTENCES = [
+    "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    "Cellular respiration releases that energy in the mitochondria of the cell.",
+    "Markets set prices where the supply curve meets the demand curve.",
+    "Elasticity measures how strongly demand responds to a change in price.",
+    "The Roman Empire built roads that carried trade across Europe.",
+    "The Industrial Revolution began in Britain in the eighteenth century.",
+    "Newton described gravity as a force between any two masses.",
+    "Shakespeare wrote his plays for the Globe Theatre in London.",
+]
+
+
+def make_book(chars, seed=0):
+    rng = random.Random(seed)
+    paragraphs, size = [], 0
+    while size < chars:
+        paragraph = " ".join(rng.choices(SENTENCES, k=rng.randint(4, 10)))
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 1
+    return "\n".join(paragraphs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hierarchical summarization stage timings")
+    parser.add_argument("--chars", type=int, default=5000000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--language", default="en")
+    args = parser.parse_args()
+
+    text = make_book(args.chars)
+    print(f"{len(text)} characters")
+    print(f"{'workers':>8} {'sections':>9} {'map':>8} {'worker s':>9} {'merge':>8} {'reduce':>8} {'total':>8}")
+    for workers in args.workers:
+        result = hierarchical_summarize(text, args.language, workers=workers)
+        timings = result.timings
+        print(f"{workers:>8} {result.sections:>9} {timings['map']:>8.2f} {timings['map_worker_seconds']:>9.2f} "
+              f"{timings['merge']:>8.3f} {timings['reduce']:>8.3f} {timings['total']:>8.2f}")
+    print(f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    print(f"summary: {result.summary}")
+
+
+if __name__ == "__main__":
+    main()
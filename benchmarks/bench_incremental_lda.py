@@ -0,0 +1,73 @@
+
+# benchmarks/bench_incremental_lda.py
+#
+# Latency of folding appended documents into a stored topic model versus
+# rebuilding it from scratch.
+#
+#     python -m benchmarks.bench_incremental_lda --documents 100000 --appended 100 1000 5000
+
+import argparse
+import random
+import tempfile
+import time
+
+from topic_identification import TopicModelStore, train_lda_model
+
+TOPICS = [
+    "cell membrane protein enzyme mitochondria energy respiration glucose",
+    "market price demand supply elasticity inflation interest bank",
+    "empire revolution king war treaty colony trade parliament",
+    "integral derivative limit function equation matrix vector proof",
+    "poem novel author character narrative metaphor chapter verse",
+]
+
+
+def make_documents(count, seed):
+    rng = random.Random(seed)
+    documents = []
+    for _ in range(count):
+        words = rng.choice(TOPICS).split() + rng.choice(TOPICS).split()
+        documents.append(" ".join(rng.choices(words, k=rng.randint(15, 40))))
+    return documents
+
+
+def check_fits(lda_model, id2word, corpus):
+    """Fails if the stored model, dictionary and corpus don't describe the same vocabulary."""
+    assert len(id2word) == lda_model.num_terms, (len(id2word), lda_model.num_terms)
+    lda_model[corpus[len(corpus) - 1]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental LDA update benchmark")
+    parser.add_argument("--documents", type=int, default=100000)
+    parser.add_argument("--appended", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--num-topics", type=int, default=5)
+    args = parser.parse_args()
+
+    base = make_documents(args.documents, seed=0)
+    print(f"{'appended':>9} {'incremental s':>14} {'full rebuild s':>15}")
+    for appended in args.appended:
+        documents = base + make_documents(appended, seed=appended)
+        with tempfile.TemporaryDirectory() as directory:
+            store = TopicModelStore(directory)
+            store.update("corpus", base, num_topics=args.num_topics)
+
+            start = time.perf_counter()
+            check_fits(*store.update("corpus", documents, num_topics=args.num_topics))
+            incremental = time.perf_counter() - start
+
+            # Appends with words the model has never seen, or none it knows, must still fit together.
+            # The drift threshold is raised so they're folded in rather than retrained.
+            store.perplexity_drift = 100.0
+            unseen = [TOPICS[0] + " zygote quasar", "zygote 42 !!"]
+            check_fits(*store.update("corpus", documents + unseen[:1], num_topics=args.num_topics))
+            check_fits(*store.update("corpus", documents + unseen, num_topics=args.num_topics))
+
+        start = time.perf_counter()
+        train_lda_model(documents, num_topics=args.num_topics)
+        full = time.perf_counter() - start
+        print(f"{appended:>9} {incremental:>14.2f} {full:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
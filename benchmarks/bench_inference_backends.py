@@ -0,0 +1,73 @@
+
+# benchmarks/bench_inference_backends.py
+#
+# Accuracy (exact match and token F1) against latency of the question
+# answering model on each inference backend, using the fixed local QA set in
+# benchmarks/data/qa_set.json.
+#
+#     python -m benchmarks.bench_inference_backends --backends torch int8 onnx
+
+import argparse
+import json
+import os
+import re
+import time
+from collections import Counter
+
+import numpy as np
+
+from inference_backends import BACKENDS, QA_MODEL, load_pipeline
+
+QA_SET = os.path.join(os.path.dirname(__file__), "data", "qa_set.json")
+
+
+def normalize(text):
+    text = re.sub(r"\b(a|an|the)\b", " ", text.lower())
+    return " ".join(re.findall(r"\w+", text))
+
+
+def f1(prediction, answer):
+    predicted, expected = normalize(prediction).split(), normalize(answer).split()
+    common = sum((Counter(predicted) & Counter(expected)).values())
+    if not common:
+        return 0.0
+    precision, recall = common / len(predicted), common / len(expected)
+    return 2 * precision * recall / (precision + recall)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference backend accuracy and latency benchmark")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--model", default=QA_MODEL)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(QA_SET) as f:
+        examples = json.load(f)
+
+    print(f"{'backend':>8} {'load s':>7} {'EM':>6} {'F1':>6} {'p50 ms':>8} {'p99 ms':>8}")
+    for backend in args.backends:
+        start = time.perf_counter()
+        qa_pipeline = load_pipeline("question-answering", args.model, backend)
+        load_seconds = time.perf_counter() - start
+        if qa_pipeline.inference_backend != backend:
+            # A fallback's numbers would be reported under the wrong backend
+            print(f"{backend:>8} skipped: unavailable, loaded {qa_pipeline.inference_backend} instead")
+            continue
+
+        exact, scores, latencies = [], [], []
+        for example in examples:
+            for repeat in range(args.repeats):
+                start = time.perf_counter()
+                result = qa_pipeline(question=example["question"], context=example["context"])
+                latencies.append((time.perf_counter() - start) * 1000)
+            exact.append(max(normalize(result["answer"]) == normalize(answer) for answer in example["answers"]))
+            scores.append(max(f1(result["answer"], answer) for answer in example["answers"]))
+
+        p50, p99 = np.percentile(latencies, [50, 99])
+        print(f"{backend:>8} {load_seconds:>7.1f} {np.mean(exact):>6.2f} {np.mean(scores):>6.2f} "
+              f"{p50:>8.1f} {p99:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+
+# benchmarks/bench_lda_scaling.py
+#
+# Wall time and peak RSS of LDA training against corpus size and worker
+# count. "memory" is the in-memory LdaModel path, a number is LdaMulticore
+# over an on-disk MmCorpus with that many workers. Each run gets its own
+# process so peak RSS is not shared between runs.
+#
+#     python -m benchmarks.bench_lda_scaling --documents 10000 100000 --workers memory 1 2 4
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_incremental_lda import make_documents
+
+
+def run(mode, count):
+    from topic_identification import train_lda_model, train_lda_model_streamed
+
+    documents = make_documents(count, seed=0)
+    start = time.perf_counter()
+    if mode == 'memory':
+        train_lda_model(documents)
+    else:
+        with tempfile.TemporaryDirectory() as corpus_dir:
+            train_lda_model_streamed(documents, workers=int(mode), corpus_dir=corpus_dir)
+    seconds = time.perf_counter() - start
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * 1024
+    print(json.dumps({'seconds': seconds, 'peak_rss_bytes': rss}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LDA training scaling benchmark")
+    parser.add_argument("--documents", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--workers", nargs="+", default=["memory", "1", "2", "4"])
+    parser.add_argument("--run", nargs=2, metavar=("MODE", "COUNT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run[0], int(args.run[1]))
+        return
+
+    print(f"{'documents':>10} {'workers':>8} {'seconds':>8} {'peak RSS MB':>12}")
+    for count in args.documents:
+        for mode in args.workers:
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_lda_scaling', '--run', mode, str(count)],
+                                    check=True, capture_output=True, text=True)
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            print(f"{count:>10} {mode:>8} {result['seconds']:>8.1f} {result['peak_rss_bytes'] / 2 ** 20:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
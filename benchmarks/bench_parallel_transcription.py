@@ -0,0 +1,68 @@
+
+# benchmarks/bench_parallel_transcription.py
+#
+# Measures wall-clock scaling of parallel segment transcription against a
+# local stub recognizer with injected latency (no network needed).
+#
+#     python -m benchmarks.bench_parallel_transcription --minutes 30 --workers 1 2 4 8
+
+import argparse
+import os
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+from video_to_audio_to_text import transcribe_segments
+
+
+class StubRecognizer:
+    """Pretends to transcribe, sleeping ``latency`` seconds per audio minute."""
+
+    def __init__(self, latency=1.0):
+        self.latency = latency
+
+    def transcribe(self, audio_content, sample_rate):
+        seconds = len(audio_content) / 2 / sample_rate
+        time.sleep(self.latency * seconds / 60)
+        return " ".join(f"word{int(seconds)}" for _ in range(5))
+
+
+def write_lecture(path, minutes, sample_rate=16000):
+    """Writes a tone with a short pause every 7 seconds, a minute at a time."""
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        t = np.arange(sample_rate * 60) / sample_rate
+        minute = (np.sin(2 * np.pi * 220 * t) * 8000 * ((t % 7) > 0.5)).astype('<i2')
+        for _ in range(minutes):
+            wav.writeframes(minute.tobytes())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel transcription scaling benchmark")
+    parser.add_argument("--minutes", type=int, default=30)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--latency", type=float, default=1.0,
+                        help="stub recognizer seconds per minute of audio")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "lecture.wav")
+        write_lecture(path, args.minutes)
+
+        print(f"{'workers':>8} {'segments':>9} {'wall s':>8} {'segment s':>10} {'speedup':>8}")
+        baseline = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            results = list(transcribe_segments(path, StubRecognizer(args.latency), max_workers=workers))
+            wall = time.perf_counter() - start
+            baseline = baseline or wall
+            segment_seconds = sum(result.seconds for result in results)
+            print(f"{workers:>8} {len(results):>9} {wall:>8.2f} {segment_seconds:>10.2f} {baseline / wall:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+
+# benchmarks/bench_preprocessing.py
+#
+# Throughput of topic_identification preprocessing in documents per second
+# for different numbers of spaCy worker processes.
+#
+#     python -m benchmarks.bench_preprocessing --documents 50000 --processes 1 2 4 8
+
+import argparse
+import random
+import time
+
+from topic_identification import iter_preprocessed
+
+WORDS = (
+    "students review lecture notes on photosynthesis and cellular respiration "
+    "while the professor explains supply demand elasticity markets and prices "
+    "in the history seminar we discussed empires trade routes and revolutions"
+).split()
+
+
+def iter_documents(count, seed=0):
+    """Yields one synthetic line-sized document at a time, like an uploaded file."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield " ".join(rng.choices(WORDS, k=rng.randint(10, 30)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocessing throughput benchmark")
+    parser.add_argument("--documents", type=int, default=50000)
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--batch-size", type=int, default=256)
+    args = parser.parse_args()
+
+    print(f"{'processes':>10} {'docs':>8} {'seconds':>8} {'docs/s':>8}")
+    for n_process in args.processes:
+        start = time.perf_counter()
+        count = 0
+        for _ in iter_preprocessed(iter_documents(args.documents), batch_size=args.batch_size, n_process=n_process):
+            count += 1
+        seconds = time.perf_counter() - start
+        print(f"{n_process:>10} {count:>8} {seconds:>8.1f} {count / seconds:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+
+# benchmarks/bench_qa_server.py
+#
+# Load test for the micro-batching QA server: N simulated users each ask a
+# series of questions concurrently, once against the pipeline directly (one
+# request at a time, as before) and once through QAServer.
+#
+#     python -m benchmarks.bench_qa_server --users 1 8 32 --questions 5
+
+import argparse
+import threading
+import time
+
+import numpy as np
+from transformers import pipeline
+
+from inference_server import QAServer
+from benchmarks.bench_question_answering import FACTS, make_document
+
+
+def simulate(ask, users, questions, context):
+    latencies = []
+    lock = threading.Lock()
+
+    def user(seed):
+        for i in range(questions):
+            question = FACTS[(seed + i) % len(FACTS)][0]
+            start = time.perf_counter()
+            ask(question, context)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=user, args=(seed,)) for seed in range(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    p50, p99 = np.percentile(latencies, [50, 99])
+    return len(latencies) / wall, p50, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching QA server load test")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait", type=float, default=0.02)
+    parser.add_argument("--context-words", type=int, default=300)
+    args = parser.parse_args()
+
+    qa_pipeline = pipeline("question-answering")
+    server = QAServer(qa_pipeline, max_batch_size=args.max_batch_size, max_wait=args.max_wait)
+    context = make_document(args.context_words)
+    pipeline_lock = threading.Lock()
+
+    def direct(question, context):
+        # Streamlit sessions shared one pipeline object; serialize like the GIL-bound original
+        with pipeline_lock:
+            return qa_pipeline(question=question, context=context)
+
+    print(f"{'users':>6} {'mode':>8} {'req/s':>7} {'p50 s':>7} {'p99 s':>7}")
+    for users in args.users:
+        for mode, ask in (("direct", direct), ("batched", lambda q, c: server(question=q, context=c))):
+            throughput, p50, p99 = simulate(ask, users, args.questions, context)
+            print(f"{users:>6} {mode:>8} {throughput:>7.1f} {p50:>7.2f} {p99:>7.2f}")
+    print(server.stats())
+
+
+if __name__ == "__main__":
+    main()
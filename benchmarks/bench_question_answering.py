@@ -0,0 +1,67 @@
+
+# benchmarks/bench_question_answering.py
+#
+# Question answering latency against document size, reading the whole
+# document versus only the passages retrieved for the question.
+#
+#     python -m benchmarks.bench_question_answering --words 1000 10000 100000
+
+import argparse
+import random
+import time
+
+from transformers import pipeline
+
+from question_answering import answer_question, get_passage_index
+
+FILLER = (
+    "the lecture continues with several examples that illustrate how the "
+    "method is applied in practice and which assumptions are usually made"
+).split()
+FACTS = [
+    ("Who proposed the theory of general relativity?", "Albert Einstein proposed the theory of general relativity in 1915."),
+    ("What is the powerhouse of the cell?", "The mitochondria is known as the powerhouse of the cell."),
+    ("When did the French Revolution begin?", "The French Revolution began in 1789 with the storming of the Bastille."),
+]
+
+
+def make_document(words, seed=0):
+    rng = random.Random(seed)
+    chunks = [" ".join(rng.choices(FILLER, k=words // len(FACTS)))
+              for _ in FACTS]
+    return " ".join(f"{chunk} {fact}" for chunk, (_, fact) in zip(chunks, FACTS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Question answering latency benchmark")
+    parser.add_argument("--words", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--full-max", type=int, default=10000,
+                        help="skip whole-document reading above this many words")
+    args = parser.parse_args()
+
+    qa_pipeline = pipeline("question-answering")
+    print(f"{'words':>8} {'mode':>10} {'first q s':>10} {'next q s':>9}")
+    for words in args.words:
+        text = make_document(words)
+        get_passage_index.cache_clear()
+
+        timings = []
+        for question, _ in FACTS:
+            start = time.perf_counter()
+            answer_question(qa_pipeline, question, text)
+            timings.append(time.perf_counter() - start)
+        later = sum(timings[1:]) / len(timings[1:])
+        print(f"{words:>8} {'retrieval':>10} {timings[0]:>10.2f} {later:>9.2f}")
+
+        if words <= args.full_max:
+            timings = []
+            for question, _ in FACTS:
+                start = time.perf_counter()
+                qa_pipeline(question=question, context=text)
+                timings.append(time.perf_counter() - start)
+            later = sum(timings[1:]) / len(timings[1:])
+            print(f"{words:>8} {'full':>10} {timings[0]:>10.2f} {later:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+
+# benchmarks/bench_rag_index.py
+#
+# Build throughput and query latency of the RAG vector index. Index sizes use
+# random unit vectors so 1M passages don't need 1M embeddings; embedding
+# throughput is measured separately on a sample of real passages.
+#
+#     python -m benchmarks.bench_rag_index --passages 10000 100000 1000000
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from rag_engine import Embedder, VectorIndex
+
+DIM = 384
+
+
+def random_vectors(rng, count):
+    vectors = rng.standard_normal((count, DIM), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG vector index benchmark")
+    parser.add_argument("--passages", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=10000)
+    parser.add_argument("--embed-sample", type=int, default=512,
+                        help="passages to embed for the embedding throughput figure, 0 to skip")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    if args.embed_sample:
+        embedder = Embedder()
+        texts = [f"Passage {i} about lecture topic {i % 37} with some explanatory text." * 8
+                 for i in range(args.embed_sample)]
+        start = time.perf_counter()
+        embedder.embed(texts)
+        print(f"embedding: {args.embed_sample / (time.perf_counter() - start):.0f} passages/s")
+
+    print(f"{'passages':>9} {'add/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for count in args.passages:
+        with tempfile.TemporaryDirectory() as directory:
+            index = VectorIndex(directory, DIM)
+            start = time.perf_counter()
+            for offset in range(0, count, args.batch):
+                size = min(args.batch, count - offset)
+                index.add([f"passage {offset + i}" for i in range(size)], random_vectors(rng, size), "bench")
+            add_rate = count / (time.perf_counter() - start)
+
+            latencies = []
+            for query in random_vectors(rng, args.queries):
+                start = time.perf_counter()
+                index.search(query)
+                latencies.append((time.perf_counter() - start) * 1000)
+            p50, p99 = np.percentile(latencies, [50, 99])
+            print(f"{count:>9} {add_rate:>10.0f} {p50:>8.2f} {p99:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+
+# benchmarks/bench_text_rank.py
+#
+# Compares the vectorized TextRank engine with the original networkx one.
+#
+#     python -m benchmarks.bench_text_rank --sizes 100 1000 10000
+
+import argparse
+import random
+import time
+
+import networkx as nx
+import spacy
+
+from text_summarization import rank_sentences
+
+WORDS = (
+    "the student reads a chapter about cell biology and writes notes on "
+    "mitochondria energy proteins membranes history of the french revolution "
+    "calculus limits derivatives integrals lecture exam professor library"
+).split()
+
+
+def make_document(n_sentences, seed=0):
+    rng = random.Random(seed)
+    sentences = []
+    for _ in range(n_sentences):
+        words = rng.choices(WORDS, k=rng.randint(8, 20))
+        sentences.append(" ".join(words).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def legacy_rank_sentences(sentences, nlp_model, n_sentences=3):
+    """The pre-vectorization implementation, kept here as the baseline."""
+    sentence_vectors = [nlp_model(sent.text).vector for sent in sentences]
+
+    similarity_matrix = nx.Graph()
+    for i, vector in enumerate(sentence_vectors):
+        for j, other_vector in enumerate(sentence_vectors):
+            if i != j:
+                similarity = vector @ other_vector
+                if similarity > 0.5:
+                    similarity_matrix.add_edge(i, j, weight=similarity)
+
+    scores = nx.pagerank(similarity_matrix)
+    return sorted(scores, key=scores.get, reverse=True)[:n_sentences]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--legacy-max", type=int, default=1000,
+                        help="skip the legacy engine above this many sentences")
+    parser.add_argument("--model", default="en_core_web_sm")
+    args = parser.parse_args()
+
+    nlp_model = spacy.load(args.model)
+    nlp_model.max_length = 10 ** 8
+
+    print(f"{'sentences':>10} {'engine':>10} {'seconds':>10}")
+    for size in args.sizes:
+        doc = nlp_model(make_document(size))
+        sentences = list(doc.sents)
+
+        start = time.perf_counter()
+        rank_sentences(sentences)
+        print(f"{len(sentences):>10} {'vectorized':>10} {time.perf_counter() - start:>10.3f}")
+
+        if len(sentences) <= args.legacy_max:
+            start = time.perf_counter()
+            legacy_rank_sentences(sentences, nlp_model)
+            print(f"{len(sentences):>10} {'legacy':>10} {time.perf_counter() - start:>10.3f}")
+        else:
+            print(f"{len(sentences):>10} {'legacy':>10} {'skipped':>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+
+# benchmarks/bench_translation_cache.py
+#
+# Requests and time of TranslationService for a first translation, the same
+# text again (a Streamlit rerun), and a partly edited text, with a stub
+# backend that sleeps per request like the web service. Also compares
+# language detection on the whole text with the sampled, cached detector.
+#
+#     python -m benchmarks.bench_translation_cache --sentences 400 --latency 0.3
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from translation import TranslationMemory, TranslationService, detect_language
+
+WORDS = (
+    "the students review lecture notes on photosynthesis while the professor explains "
+    "supply and demand in markets and the seminar discusses empires and trade routes"
+).split()
+
+
+class StubBackend:
+    """Stands in for the translation service: fixed latency per request, no network."""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.requests = 0
+
+    def translate_batch(self, texts, dest):
+        self.requests += 1
+        time.sleep(self.latency)
+        return [f"[{dest}] {text}" for text in texts]
+
+
+def make_text(sentences, rng):
+    return " ".join(" ".join(rng.choices(WORDS, k=rng.randint(8, 20))).capitalize() + "." for _ in range(sentences))
+
+
+def edit_text(text, fraction, rng):
+    """Rewrites ``fraction`` of the sentences, the way a user edits a document and translates it again."""
+    sentences = text.split(". ")
+    for index in rng.sample(range(len(sentences)), int(len(sentences) * fraction)):
+        sentences[index] = " ".join(rng.choices(WORDS, k=12)).capitalize()
+    return ". ".join(sentences)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Translation memory benchmark")
+    parser.add_argument("--sentences", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--edited", type=float, default=0.2)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    text = make_text(args.sentences, rng)
+    edited = edit_text(text, args.edited, rng)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = StubBackend(args.latency)
+        service = TranslationService(backend, TranslationMemory(os.path.join(tmp, "translations.sqlite3")))
+        print(f"{len(text)} characters, {args.sentences} sentences, {args.latency}s per request")
+        print(f"{'pass':>10} {'requests':>9} {'hit rate':>9} {'seconds':>8}")
+        # Without batching every sentence was its own request
+        print(f"{'unbatched':>10} {args.sentences:>9} {0.0:>9.2f} {args.sentences * args.latency:>8.1f}")
+        for name, document in (("first", text), ("repeat", text), ("edited", edited)):
+            before_requests = backend.requests
+            before = service.stats()
+            start = time.perf_counter()
+            service.translate(document, "Spanish")
+            seconds = time.perf_counter() - start
+            after = service.stats()
+            sentences = after["sentences"] - before["sentences"]
+            hits = after["memory_hits"] - before["memory_hits"]
+            print(f"{name:>10} {backend.requests - before_requests:>9} {hits / max(sentences, 1):>9.2f} {seconds:>8.2f}")
+
+    document = make_text(args.sentences * 20, rng)
+    for name, detector in (("full", lambda: __import__("langdetect").detect(document)),
+                           ("sampled", lambda: detect_language(document)),
+                           ("cached", lambda: detect_language(document))):
+        start = time.perf_counter()
+        language = detector()
+        print(f"detect {name:>8}: {language} in {time.perf_counter() - start:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+
+# benchmarks/run_all.py
+#
+# Runs every pipeline headlessly (no Streamlit, no network) on generated
+# fixtures of increasing size and emits wall time, CPU time, peak RSS and the
+# per-stage spans recorded by tracing as JSON. Each pipeline and size runs in
+# its own process with an empty cache directory, so results are cold and
+# peak RSS is not shared between runs. Compare a run against an earlier
+# commit's output with --compare.
+#
+#     python -m benchmarks.run_all --scales 1 2 4 --output bench-$(git rev-parse --short HEAD).json
+#     python -m benchmarks.run_all --pipelines summarization qa --compare bench-abc1234.json
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Fixture size per pipeline at scale 1
+BASE_SIZES = {
+    "transcription": 2,         # minutes of video
+    "extraction_pdf": 100,      # pages
+    "extraction_docx": 2000,    # paragraphs
+    "summarization": 50000,     # characters
+    "keywords_ner": 50000,      # characters
+    "lda": 2000,                # documents
+    "qa": 20000,                # words
+}
+# Runs slower or larger than this ratio of the baseline are reported as regressions
+REGRESSION_RATIO = 1.2
+
+QA_FACTS = [
+    ("Who proposed the theory of general relativity?", "Albert Einstein proposed the theory of general relativity in 1915."),
+    ("What is the powerhouse of the cell?", "The mitochondria is known as the powerhouse of the cell."),
+    ("When did the French Revolution begin?", "The French Revolution began in 1789 with the storming of the Bastille."),
+]
+
+
+class StubReader:
+    """Stands in for the question-answering pipeline: answers with the first words of each context."""
+
+    def __call__(self, question, context, **kwargs):
+        answers = [{"answer": " ".join(text.split()[:3]), "score": 1.0 / (1 + len(text)), "start": 0, "end": 0}
+                   for text in context]
+        return answers[0] if len(answers) == 1 else answers
+
+
+def prepare_transcription(size, tmp):
+    from benchmarks.bench_audio_extraction import make_video
+    from benchmarks.bench_parallel_transcription import StubRecognizer
+    from video_to_audio_to_text import transcribe_video
+
+    # A real video, so the ffmpeg decode is measured along with recognition
+    path = os.path.join(tmp, "lecture.mp4")
+    make_video(path, size)
+
+    def run():
+        results = list(transcribe_video(path, StubRecognizer(latency=0.5)))
+        return {"segments": len(results)}
+    return run
+
+
+def prepare_extraction_pdf(size, tmp):
+    from benchmarks.bench_document_extraction import make_pdf
+    from document_extraction import iter_pdf_pages
+
+    path = os.path.join(tmp, "book.pdf")
+    make_pdf(path, size)
+
+    def run():
+        chars = sum(len(page) for page in iter_pdf_pages(path))
+        return {"chars": chars}
+    return run
+
+
+def prepare_extraction_docx(size, tmp):
+    from docx import Document
+
+    from document_extraction import iter_docx_blocks
+
+    rng = random.Random(0)
+    path = os.path.join(tmp, "notes.docx")
+    doc = Document()
+    for _ in range(size):
+        doc.add_paragraph(" ".join(rng.choices([fact for _, fact in QA_FACTS], k=3)))
+    doc.save(path)
+
+    def run():
+        chars = sum(len(block) for block in iter_docx_blocks(path))
+        return {"chars": chars}
+    return run
+
+
+def prepare_summarization(size, tmp):
+    from benchmarks.bench_hierarchical_summary import make_book
+    from text_summarization import MODELS, text_rank_summarize
+
+    text = make_book(size)
+    nlp_model = MODELS["en"]
+
+    def run():
+        return {"summary_chars": len(text_rank_summarize(text, nlp_model))}
+    return run
+
+
+def prepare_keywords_ner(size, tmp):
+    from benchmarks.bench_hierarchical_summary import make_book
+    from text_summarization import MODELS, display_named_entities, extract_keywords
+
+    text = make_book(size)
+    nlp_model = MODELS["en"]
+
+    def run():
+        keywords = extract_keywords(nlp_model, text)
+        entities = display_named_entities(nlp_model, text)
+        return {"keywords": len(keywords), "entities": len(entities)}
+    return run
+
+
+def prepare_lda(size, tmp):
+    from benchmarks.bench_incremental_lda import make_documents
+    from topic_identification import build_lda_model
+
+    documents = make_documents(size, seed=0)
+
+    def run():
+        lda_model, _, _ = build_lda_model(documents, num_topics=5)
+        return {"topics": lda_model.num_topics}
+    return run
+
+
+def prepare_qa(size, tmp):
+    from question_answering import answer_question
+
+    rng = random.Random(0)
+    filler = "the lecture continues with examples that show how the method is applied in practice".split()
+    text = " ".join(f"{' '.join(rng.choices(filler, k=size // len(QA_FACTS)))} {fact}" for _, fact in QA_FACTS)
+    reader = StubReader()
+    if os.environ.get("EDU_ASSIST_BENCH_REAL_MODELS"):
+        from inference_backends import load_qa_pipeline
+        reader = load_qa_pipeline()
+
+    def run():
+        answers = [answer_question(reader, question, text)[0]["answer"] for question, _ in QA_FACTS]
+        return {"questions": len(answers)}
+    return run
+
+
+PIPELINES = {
+    "transcription": prepare_transcription,
+    "extraction_pdf": prepare_extraction_pdf,
+    "extraction_docx": prepare_extraction_docx,
+    "summarization": prepare_summarization,
+    "keywords_ner": prepare_keywords_ner,
+    "lda": prepare_lda,
+    "qa": prepare_qa,
+}
+
+
+def run_pipeline(pipeline, scale):
+    """Runs one pipeline at one scale in this process and prints its result as a JSON line."""
+    from tracing import tracer
+
+    size = BASE_SIZES[pipeline] * scale
+    with tempfile.TemporaryDirectory() as tmp:
+        run = PIPELINES[pipeline](size, tmp)
+        tracer.enable()
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        cpu_start = time.process_time()
+        children_start = os.times()
+        start = time.perf_counter()
+        with tracer.capture() as spans:
+            details = run()
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        children = os.times()
+        children_cpu = (children.children_user - children_start.children_user
+                        + children.children_system - children_start.children_system)
+
+    print(json.dumps({
+        "pipeline": pipeline,
+        "scale": scale,
+        "size": size,
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        "children_cpu_seconds": children_cpu,
+        # Peak RSS covers fixture generation too, the fixture's own peak is reported for reference
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "fixture_peak_rss_bytes": rss_before,
+        "children_peak_rss_bytes": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+        "details": details,
+        "stages": tracer.summary(spans),
+    }))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], check=True, capture_output=True,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, ratio=REGRESSION_RATIO):
+    """Prints wall time and peak RSS against an earlier run, returning the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = {(result["pipeline"], result["scale"]): result for result in json.load(f)["results"]}
+    regressions = 0
+    print(f"\n{'pipeline':>16} {'scale':>6} {'wall':>8} {'peak RSS':>9}", file=sys.stderr)
+    for result in results:
+        previous = baseline.get((result["pipeline"], result["scale"]))
+        if previous is None:
+            continue
+        wall = result["wall_seconds"] / max(previous["wall_seconds"], 1e-9)
+        rss = result["peak_rss_bytes"] / max(previous["peak_rss_bytes"], 1)
+        flag = " REGRESSION" if wall > ratio or rss > ratio else ""
+        regressions += bool(flag)
+        print(f"{result['pipeline']:>16} {result['scale']:>6} {wall:>7.2f}x {rss:>8.2f}x{flag}", file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of every pipeline")
+    parser.add_argument("--pipelines", nargs="+", choices=list(PIPELINES), default=list(PIPELINES))
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--output", default="-", help="JSON file to write, - for stdout")
+    parser.add_argument("--compare", help="earlier JSON output to compare against")
+    parser.add_argument("--real-models", action="store_true",
+                        help="use the real question-answering model instead of a stub reader")
+    parser.add_argument("--run", nargs=2, metavar=("PIPELINE", "SCALE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_pipeline(args.run[0], int(args.run[1]))
+        return
+
+    results = []
+    print(f"{'pipeline':>16} {'scale':>6} {'size':>8} {'wall s':>8} {'CPU s':>8} {'peak RSS MB':>12}", file=sys.stderr)
+    for pipeline in args.pipelines:
+        for scale in args.scales:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                # A fresh cache directory per run, so no result is served from an earlier one
+                env = dict(os.environ, EDU_ASSIST_CACHE_DIR=cache_dir)
+                if args.real_models:
+                    env["EDU_ASSIST_BENCH_REAL_MODELS"] = "1"
+                output = subprocess.run([sys.executable, "-m", "benchmarks.run_all", "--run", pipeline, str(scale)],
+                                        env=env, capture_output=True, text=True)
+            if output.returncode != 0:
+                print(f"{pipeline} at scale {scale} failed:\n{output.stderr}", file=sys.stderr)
+                continue
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{pipeline:>16} {scale:>6} {result['size']:>8} {result['wall_seconds']:>8.2f} "
+                  f"{result['cpu_seconds'] + result['children_cpu_seconds']:>8.2f} "
+                  f"{result['peak_rss_bytes'] / 2 ** 20:>12.0f}", file=sys.stderr)
+
+    report = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    if args.output == "-":
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare and compare(results, args.compare):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+
+# document_extraction.py
+
+import io
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+from docx import Document
+
+from result_cache import cache
+from tracing import traced
+
+# PDFs with at least this many pages are split across worker processes
+PARALLEL_MIN_PAGES = 200
+PDF_WORKERS = min(4, os.cpu_count() or 1)
+# Pages each worker extracts per task
+PAGE_CHUNK = 32
+# DOCX paragraphs are yielded in blocks of roughly this many characters
+DOCX_BLOCK_CHARS = 20000
+
+PDF_TYPE = "application/pdf"
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Document opened once by each extraction worker
+worker_doc = None
+
+
+def read_bytes(source):
+    """Returns the bytes of an uploaded file, file object or path."""
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            return f.read()
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    return source.read()
+
+
+def open_pdf(source):
+    if isinstance(source, str):
+        return fitz.open(source)
+    return fitz.open(stream=read_bytes(source), filetype="pdf")
+
+
+def open_worker_doc(path):
+    global worker_doc
+    worker_doc = fitz.open(path)
+
+
+def extract_page_range(start, stop):
+    return [worker_doc[number].get_text() for number in range(start, stop)]
+
+
+def pdf_page_count(source):
+    with open_pdf(source) as doc:
+        return doc.page_count
+
+
+@traced()
+def iter_pdf_pages(source, workers=PDF_WORKERS, chunk_pages=PAGE_CHUNK, parallel_min_pages=PARALLEL_MIN_PAGES):
+    """Yields the text of each PDF page in order.
+
+    Large documents are extracted by ``workers`` processes, each handling
+    ``chunk_pages`` pages at a time. Only a few chunks are in flight at once,
+    so memory stays bounded by the chunk size rather than the document size.
+    """
+    with open_pdf(source) as doc:
+        page_count = doc.page_count
+        if workers <= 1 or page_count < parallel_min_pages:
+            for page in doc:
+                yield page.get_text()
+            return
+
+    # Workers open the document from disk rather than receiving its bytes
+    path = source if isinstance(source, str) else cache.upload_path(read_bytes(source), '.pdf')
+    ranges = [(start, min(start + chunk_pages, page_count)) for start in range(0, page_count, chunk_pages)]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=open_worker_doc, initargs=(path,)) as pool:
+        # Keep a couple of chunks queued per worker and hand out pages in order
+        pending = deque()
+        remaining = iter(ranges)
+        for start, stop in remaining:
+            pending.append(pool.submit(extract_page_range, start, stop))
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            pages = pending.popleft().result()
+            following = next(remaining, None)
+            if following is not None:
+                pending.append(pool.submit(extract_page_range, *following))
+            yield from pages
+
+
+@traced()
+def iter_docx_blocks(source, block_chars=DOCX_BLOCK_CHARS):
+    """Yields the paragraphs of a DOCX file joined into blocks of about ``block_chars`` characters."""
+    content = source if isinstance(source, str) else io.BytesIO(read_bytes(source))
+    block, size = [], 0
+    for para in Document(content).paragraphs:
+        block.append(para.text)
+        size += len(para.text) + 1
+        if size >= block_chars:
+            yield "\n".join(block)
+            block, size = [], 0
+    if block:
+        yield "\n".join(block)
+
+
+@traced()
+def iter_text_blocks(source, block_chars=DOCX_BLOCK_CHARS):
+    """Yields a UTF-8 text file in blocks of about ``block_chars`` characters, split on line boundaries."""
+    if isinstance(source, str):
+        lines = open(source, encoding="utf-8")
+    else:
+        lines = io.StringIO(read_bytes(source).decode("utf-8"))
+    with lines:
+        block, size = [], 0
+        for line in lines:
+            block.append(line)
+            size += len(line)
+            if size >= block_chars:
+                yield "".join(block)
+                block, size = [], 0
+        if block:
+            yield "".join(block)
+
+
+def iter_document(source, file_type):
+    """Yields the text of an uploaded PDF, DOCX or text file block by block."""
+    if file_type == PDF_TYPE:
+        return iter_pdf_pages(source)
+    if file_type == DOCX_TYPE:
+        return iter_docx_blocks(source)
+    if file_type == "text/plain":
+        return iter_text_blocks(source)
+    raise ValueError(f"Unsupported document type '{file_type}'")
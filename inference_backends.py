@@ -0,0 +1,122 @@
+
+# inference_backends.py
+
+import os
+import re
+import shutil
+import threading
+
+from result_cache import CACHE_DIR
+
+# "auto" tries ONNX Runtime, then dynamic int8 quantization, then plain PyTorch
+INFERENCE_BACKEND = os.environ.get("EDU_ASSIST_INFERENCE_BACKEND", "auto")
+BACKENDS = ("onnx", "int8", "torch")
+# Exported and quantized models are written here once and reused
+ARTIFACT_DIR = os.path.join(CACHE_DIR, "models")
+# The checkpoint pipeline("question-answering") picks by default
+QA_MODEL = "distilbert/distilbert-base-cased-distilled-squad"
+
+# transformers and optimum model classes for each task we serve
+TASK_MODELS = {
+    "question-answering": ("AutoModelForQuestionAnswering", "ORTModelForQuestionAnswering"),
+    "text2text-generation": ("AutoModelForSeq2SeqLM", "ORTModelForSeq2SeqLM"),
+    "translation": ("AutoModelForSeq2SeqLM", "ORTModelForSeq2SeqLM"),
+    "feature-extraction": ("AutoModel", "ORTModelForFeatureExtraction"),
+}
+
+
+def artifact_path(backend, model_name):
+    return os.path.join(ARTIFACT_DIR, backend, re.sub(r"[^\w.-]", "_", model_name))
+
+
+def scratch_path(path):
+    # Artifacts are written here first and renamed into place, so no process ever loads half of one
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+
+
+def load_onnx(task, model_name):
+    import optimum.onnxruntime
+
+    model_class = getattr(optimum.onnxruntime, TASK_MODELS[task][1])
+    path = artifact_path("onnx", model_name)
+    if os.path.isdir(path):
+        try:
+            return model_class.from_pretrained(path)
+        except Exception as e:
+            # Left half-written by an export that was interrupted before exports were renamed into place
+            print(f"Discarding unreadable ONNX export {path}: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+    model = model_class.from_pretrained(model_name, export=True)
+    scratch = scratch_path(path)
+    model.save_pretrained(scratch)
+    try:
+        os.replace(scratch, path)
+    except OSError:
+        # Another process finished the same export first, keep its copy
+        shutil.rmtree(scratch, ignore_errors=True)
+    return model
+
+
+def load_int8(task, model_name):
+    import torch
+    import transformers
+
+    path = artifact_path("int8", model_name) + ".pt"
+    if os.path.exists(path):
+        try:
+            return torch.load(path, weights_only=False)
+        except Exception as e:
+            print(f"Discarding unreadable quantized model {path}: {e}")
+            os.remove(path)
+    model_class = getattr(transformers, TASK_MODELS[task][0])
+    model = model_class.from_pretrained(model_name).eval()
+    # Linear layers hold nearly all the weights and FLOPs of these models
+    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    scratch = scratch_path(path)
+    torch.save(model, scratch)
+    os.replace(scratch, path)
+    return model
+
+
+def load_torch(task, model_name):
+    import transformers
+
+    model_class = getattr(transformers, TASK_MODELS[task][0])
+    return model_class.from_pretrained(model_name).eval()
+
+
+LOADERS = {"onnx": load_onnx, "int8": load_int8, "torch": load_torch}
+
+
+def load_model(task, model_name, backend=INFERENCE_BACKEND):
+    """Returns (model, backend) using the first backend that loads, falling back towards PyTorch."""
+    if backend != "auto" and backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected 'auto' or one of {', '.join(BACKENDS)}")
+    candidates = BACKENDS if backend == "auto" else BACKENDS[BACKENDS.index(backend):]
+    for candidate in candidates:
+        try:
+            return LOADERS[candidate](task, model_name), candidate
+        except Exception as e:
+            if candidate == "torch":
+                raise
+            print(f"Inference backend {candidate} unavailable for {model_name}, falling back: {e}")
+
+
+def load_pipeline(task, model_name, backend=INFERENCE_BACKEND):
+    """Builds a transformers pipeline for ``task`` on the selected inference backend.
+
+    The backend that actually loaded, which may be a fallback, is stored on
+    the pipeline as ``inference_backend``.
+    """
+    from transformers import AutoTokenizer, pipeline
+
+    model, used = load_model(task, model_name, backend)
+    print(f"Loaded {model_name} for {task} on the {used} backend")
+    loaded = pipeline(task, model=model, tokenizer=AutoTokenizer.from_pretrained(model_name))
+    loaded.inference_backend = used
+    return loaded
+
+
+def load_qa_pipeline(model_name=QA_MODEL, backend=INFERENCE_BACKEND):
+    return load_pipeline("question-answering", model_name, backend)
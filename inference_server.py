@@ -0,0 +1,125 @@
+
+# inference_server.py
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from tracing import traced
+
+# Requests are collected for at most this long before a batch runs
+MAX_WAIT_SECONDS = 0.02
+MAX_BATCH_SIZE = 16
+
+
+class MicroBatcher:
+    """Collects concurrent requests for a short window and runs them as one batch.
+
+    ``handler`` takes a list of request items and returns a list of results
+    in the same order. Callers get a Future per item from ``submit``. A
+    single background thread owns the model, so callers from every session
+    share it without contending for it.
+    """
+
+    def __init__(self, handler, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_WAIT_SECONDS, history=1000):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._batches = deque(maxlen=history)
+        self._latencies = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def __call__(self, item, timeout=None):
+        return self.submit(item).result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            queue_depth = self._queue.qsize()
+            started = time.perf_counter()
+            try:
+                results = self.handler([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"Handler returned {len(results)} results for {len(batch)} requests")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            finished = time.perf_counter()
+            for (_, future, submitted), result in zip(batch, results):
+                future.set_result(result)
+                self._latencies.append(finished - submitted)
+            self._batches.append((len(batch), queue_depth, finished - started))
+
+    def stats(self):
+        """Summary of recent batches: sizes, queue depth and request latency."""
+        batches = list(self._batches)
+        latencies = list(self._latencies)
+        if not batches:
+            return {"batches": 0, "requests": 0, "queue_depth": self._queue.qsize()}
+        sizes = [size for size, _, _ in batches]
+        p50, p99 = np.percentile(latencies, [50, 99]) if latencies else (0.0, 0.0)
+        return {
+            "batches": len(batches),
+            "requests": sum(sizes),
+            "mean_batch_size": sum(sizes) / len(sizes),
+            "max_queue_depth": max(depth for _, depth, _ in batches),
+            "queue_depth": self._queue.qsize(),
+            "mean_batch_seconds": sum(seconds for _, _, seconds in batches) / len(batches),
+            "latency_p50": float(p50),
+            "latency_p99": float(p99),
+        }
+
+
+class QAServer:
+    """Shared question-answering service that micro-batches requests from every session.
+
+    Called like the transformers pipeline (``server(question=..., context=...)``
+    with strings or lists), so it can stand in for ``qa_pipeline`` anywhere.
+    """
+
+    def __init__(self, qa_pipeline, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_WAIT_SECONDS):
+        self.qa_pipeline = qa_pipeline
+        self.batcher = MicroBatcher(self._answer_batch, max_batch_size=max_batch_size, max_wait=max_wait)
+
+    @traced()
+    def _answer_batch(self, items):
+        questions = [question for question, _ in items]
+        contexts = [context for _, context in items]
+        answers = self.qa_pipeline(question=questions, context=contexts, batch_size=len(items))
+        return [answers] if isinstance(answers, dict) else list(answers)
+
+    def __call__(self, question, context, timeout=None):
+        if isinstance(question, str):
+            return self.batcher((question, context), timeout)
+        futures = [self.batcher.submit(pair) for pair in zip(question, context)]
+        return [future.result(timeout) for future in futures]
+
+    def stats(self):
+        return self.batcher.stats()
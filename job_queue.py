@@ -0,0 +1,203 @@
+
+# job_queue.py
+
+import importlib
+import json
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from result_cache import CACHE_DIR, cache, connect, content_key
+from tracing import traced
+
+JOBS_DB = os.path.join(CACHE_DIR, "jobs.sqlite3")
+
+# Job functions by type. Each takes its parameters as keyword arguments plus
+# ``progress(fraction, message)`` and returns a picklable result.
+JOB_TYPES = {
+    "transcription": "video_to_audio_to_text:transcription_job",
+    "summarize": "text_summarization:insights_job",
+    "summarize_file": "text_summarization:file_insights_job",
+    "topics": "topic_identification:topics_job",
+}
+
+# Jobs of each type allowed to run at once. Every type has its own workers, so
+# a long transcription never holds up summaries or topics.
+JOB_CONCURRENCY = {
+    "transcription": 2,
+    "summarize": 2,
+    "summarize_file": 2,
+    "topics": 2,
+}
+
+ACTIVE_STATUSES = ("queued", "running")
+# Finished jobs and their results are kept this long for reruns and duplicate submissions
+JOB_RETENTION_SECONDS = 24 * 3600
+
+
+def set_status(db_path, job_id, **fields):
+    fields["updated"] = time.time()
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with connect(db_path) as db:
+        db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+
+@traced()
+def run_job(db_path, job_id, target, params):
+    """Entry point in the worker process: runs ``module:function`` and records its outcome."""
+    module_name, function_name = target.split(":")
+    function = getattr(importlib.import_module(module_name), function_name)
+
+    def progress(fraction, message=""):
+        set_status(db_path, job_id, progress=float(fraction), message=message)
+
+    set_status(db_path, job_id, status="running")
+    try:
+        result = function(progress=progress, **params)
+    except Exception as e:
+        set_status(db_path, job_id, status="failed", error=f"{type(e).__name__}: {e}")
+        return
+    set_status(db_path, job_id, status="done", progress=1.0,
+               result=pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+class JobQueue:
+    """Runs heavy pipelines in worker processes, tracking them in a SQLite job table.
+
+    Jobs are identified by an ID that callers keep (e.g. in Streamlit session
+    state) and poll with ``status``. Submitting a job identical to one that is
+    queued, running or finished returns the existing job instead of starting
+    another, so script reruns never restart work.
+    """
+
+    def __init__(self, db_path=JOBS_DB, concurrency=None):
+        self.db_path = db_path
+        self.concurrency = dict(JOB_CONCURRENCY, **(concurrency or {}))
+        self._pools = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with connect(db_path) as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    job_type TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT NOT NULL DEFAULT '',
+                    result BLOB,
+                    error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key)")
+            # Workers from a previous process are gone, their jobs will never finish
+            db.execute("UPDATE jobs SET status = 'failed', error = 'Interrupted by a restart' "
+                       "WHERE status IN ('queued', 'running')")
+            db.execute("DELETE FROM jobs WHERE updated < ?", (time.time() - JOB_RETENTION_SECONDS,))
+        # ... and the files they pinned are no longer needed
+        cache.clear_pins()
+
+    def _pool(self, job_type):
+        with self._lock:
+            if job_type not in self._pools:
+                # Spawned workers don't inherit the Streamlit server's threads and sockets
+                self._pools[job_type] = ProcessPoolExecutor(max_workers=self.concurrency.get(job_type, 1),
+                                                            mp_context=multiprocessing.get_context("spawn"))
+            return self._pools[job_type]
+
+    def _discard_pool(self, job_type, pool):
+        # A pool whose worker died (OOM, segfault) is broken for good, the next submit gets a new one
+        with self._lock:
+            if self._pools.get(job_type) is pool:
+                del self._pools[job_type]
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, job_type, *args):
+        pool = self._pool(job_type)
+        try:
+            return pool, pool.submit(*args)
+        except BrokenProcessPool:
+            self._discard_pool(job_type, pool)
+            pool = self._pool(job_type)
+            return pool, pool.submit(*args)
+
+    def submit(self, job_type, **params):
+        """Queues a job and returns its ID, or the ID of an identical job already in flight or done."""
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type '{job_type}'")
+        key = content_key(job_type, json.dumps(params, sort_keys=True))
+        now = time.time()
+        with self._lock, connect(self.db_path) as db:
+            row = db.execute("SELECT id FROM jobs WHERE key = ? AND status != 'failed' ORDER BY created DESC LIMIT 1",
+                             (key,)).fetchone()
+            if row is not None:
+                return row[0]
+            job_id = uuid.uuid4().hex
+            db.execute("INSERT INTO jobs (id, job_type, key, status, created, updated) VALUES (?, ?, ?, 'queued', ?, ?)",
+                       (job_id, job_type, key, now, now))
+        # Uploads the job reads must outlive newer uploads pushing the cache over budget while it waits
+        files = [value for value in params.values() if isinstance(value, str) and cache.owns(value)]
+        for path in files:
+            cache.pin(path)
+        try:
+            pool, future = self._submit(job_type, run_job, self.db_path, job_id, JOB_TYPES[job_type], params)
+        except Exception as e:
+            # A queued row nothing will run would be returned to every identical submission
+            set_status(self.db_path, job_id, status="failed", error=f"{type(e).__name__}: {e}")
+            for path in files:
+                cache.unpin(path)
+            raise
+        future.add_done_callback(lambda done: self._finish(job_type, pool, job_id, files, done))
+        return job_id
+
+    def _finish(self, job_type, pool, job_id, files, future):
+        try:
+            self._check_crash(job_type, pool, job_id, future)
+        finally:
+            for path in files:
+                cache.unpin(path)
+
+    def _check_crash(self, job_type, pool, job_id, future):
+        # run_job records its own failures, this only catches a worker dying outright
+        if future.cancelled():
+            set_status(self.db_path, job_id, status="failed", error="Cancelled")
+            return
+        error = future.exception()
+        if error is not None:
+            set_status(self.db_path, job_id, status="failed", error=f"{type(error).__name__}: {error}")
+            if isinstance(error, BrokenProcessPool):
+                self._discard_pool(job_type, pool)
+
+    def status(self, job_id):
+        """Returns the job's status, progress, message and error (or None if unknown)."""
+        with connect(self.db_path) as db:
+            row = db.execute("SELECT job_type, status, progress, message, error FROM jobs WHERE id = ?",
+                             (job_id,)).fetchone()
+        if row is None:
+            return None
+        job_type, status, progress, message, error = row
+        return {"id": job_id, "job_type": job_type, "status": status, "progress": progress,
+                "message": message, "error": error}
+
+    def result(self, job_id):
+        """Returns the result of a finished job, or None if it hasn't finished."""
+        with connect(self.db_path) as db:
+            row = db.execute("SELECT result FROM jobs WHERE id = ? AND status = 'done'", (job_id,)).fetchone()
+        return pickle.loads(row[0]) if row and row[0] is not None else None
+
+    def active(self):
+        """Counts queued and running jobs per type."""
+        with connect(self.db_path) as db:
+            rows = db.execute("SELECT job_type, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY job_type",
+                              ACTIVE_STATUSES).fetchall()
+        return dict(rows)
+
+    def shutdown(self, wait=True):
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait)
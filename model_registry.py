@@ -0,0 +1,122 @@
+
+# model_registry.py
+
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import spacy
+
+from tracing import current_rss
+
+# spaCy pipelines available per language
+MODEL_NAMES = {
+    'en': 'en_core_web_sm',
+    'es': 'es_core_news_sm',
+    'fr': 'fr_core_news_sm',
+    'de': 'de_core_news_sm',
+    'pt': 'pt_core_news_sm',
+}
+
+# Memory budget for loaded pipelines, 0 means unlimited
+DEFAULT_MEMORY_BUDGET_MB = int(os.environ.get("EDU_ASSIST_MODEL_MEMORY_MB", "0"))
+
+
+class ModelRegistry:
+    """Loads spaCy pipelines on first use and shares one instance per language.
+
+    Callers that don't need every component should pass ``disable`` when
+    running the pipeline (``nlp(text, disable=[...])``) instead of loading a
+    second copy. When the RSS attributed to loaded pipelines exceeds
+    ``memory_budget_mb`` the least recently used ones are evicted.
+    """
+
+    def __init__(self, model_names=None, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+        self.model_names = dict(model_names or MODEL_NAMES)
+        self.memory_budget_mb = memory_budget_mb
+        self.metrics_hooks = []
+        self._models = OrderedDict()
+        self._rss = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, language):
+        return language in self.model_names
+
+    def __getitem__(self, language):
+        return self.get(language)
+
+    def add_metrics_hook(self, hook):
+        """Registers ``hook(event)`` to be called with a dict on every load and eviction."""
+        self.metrics_hooks.append(hook)
+
+    def _emit(self, **event):
+        for hook in self.metrics_hooks:
+            try:
+                hook(event)
+            except Exception as e:
+                print(f"Error in model metrics hook: {e}")
+
+    def loaded(self):
+        return list(self._models)
+
+    def memory_usage(self):
+        """Returns the RSS in bytes attributed to each loaded pipeline."""
+        return dict(self._rss)
+
+    def get(self, language):
+        if language not in self.model_names:
+            raise KeyError(f"No spaCy model configured for language '{language}'")
+
+        with self._lock:
+            if language in self._models:
+                self._models.move_to_end(language)
+                return self._models[language]
+
+            name = self.model_names[language]
+            rss_before = current_rss()
+            start = time.perf_counter()
+            nlp = spacy.load(name)
+            seconds = time.perf_counter() - start
+            rss = max(current_rss() - rss_before, 0)
+
+            self._models[language] = nlp
+            self._rss[language] = rss
+            self._emit(event="load", language=language, model=name, seconds=seconds, rss_bytes=rss)
+            self._evict()
+            return nlp
+
+    def _evict(self):
+        if not self.memory_budget_mb:
+            return
+        budget = self.memory_budget_mb * 1024 * 1024
+        # Always keep the most recently used pipeline, even if it is over budget alone
+        while len(self._models) > 1 and sum(self._rss.values()) > budget:
+            language, _ = self._models.popitem(last=False)
+            rss = self._rss.pop(language)
+            self._emit(event="evict", language=language, model=self.model_names[language], rss_bytes=rss)
+        gc.collect()
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._rss.clear()
+            gc.collect()
+
+
+def print_metrics(event):
+    """Metrics hook that logs cold-start time and RSS to stdout."""
+    rss_mb = event["rss_bytes"] / (1024 * 1024)
+    if event["event"] == "load":
+        print(f"Loaded spaCy model {event['model']} in {event['seconds']:.2f}s ({rss_mb:.0f} MB RSS)")
+    else:
+        print(f"Evicted spaCy model {event['model']} ({rss_mb:.0f} MB RSS)")
+
+
+registry = ModelRegistry()
+
+
+def get_model(language):
+    """Returns the shared spaCy pipeline for ``language``, loading it if needed."""
+    return registry.get(language)
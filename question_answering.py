@@ -0,0 +1,104 @@
+
+# question_answering.py
+
+import re
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+from scipy import sparse
+
+from tracing import traced
+
+# Passages are windows of this many words, overlapping so answers aren't cut in half
+PASSAGE_WORDS = 200
+PASSAGE_OVERLAP = 50
+# Passages handed to the reader model per question
+TOP_K = 3
+
+
+def tokenize(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def split_passages(text, passage_words=PASSAGE_WORDS, overlap=PASSAGE_OVERLAP):
+    words = text.split()
+    if len(words) <= passage_words:
+        return [" ".join(words)]
+    step = passage_words - overlap
+    return [" ".join(words[start:start + passage_words]) for start in range(0, len(words) - overlap, step)]
+
+
+class PassageIndex:
+    """BM25 index over the overlapping passages of one document.
+
+    Term weights are precomputed into a sparse passages x terms matrix, so
+    scoring a question is a column slice and a sum.
+    """
+
+    @traced()
+    def __init__(self, text, passage_words=PASSAGE_WORDS, overlap=PASSAGE_OVERLAP, k1=1.5, b=0.75):
+        self.passages = split_passages(text, passage_words, overlap)
+        self.vocabulary = {}
+        rows, cols, counts = [], [], []
+        lengths = []
+        for row, passage in enumerate(self.passages):
+            tokens = tokenize(passage)
+            lengths.append(len(tokens))
+            for term, count in Counter(tokens).items():
+                rows.append(row)
+                cols.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                counts.append(count)
+
+        n = len(self.passages)
+        tf = sparse.csr_matrix((np.asarray(counts, dtype=np.float32), (rows, cols)),
+                               shape=(n, len(self.vocabulary)))
+        document_frequency = np.bincount(cols, minlength=len(self.vocabulary))
+        idf = np.log(1 + (n - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+
+        lengths = np.asarray(lengths, dtype=np.float32)
+        norm = k1 * (1 - b + b * lengths / max(lengths.mean(), 1.0))
+        tf = tf.tocoo()
+        weights = idf[tf.col] * tf.data * (k1 + 1) / (tf.data + norm[tf.row])
+        self.weights = sparse.csc_matrix((weights, (tf.row, tf.col)), shape=tf.shape)
+
+    @traced()
+    def search(self, question, top_k=TOP_K):
+        """Returns [(passage_index, score)] for the best ``top_k`` passages."""
+        terms = [self.vocabulary[term] for term in set(tokenize(question)) if term in self.vocabulary]
+        if not terms:
+            return [(index, 0.0) for index in range(min(top_k, len(self.passages)))]
+        scores = np.asarray(self.weights[:, terms].sum(axis=1)).ravel()
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [(int(index), float(scores[index])) for index in best]
+
+
+@lru_cache(maxsize=16)
+@traced()
+def get_passage_index(text):
+    """Builds the passage index for a document once and reuses it for every question."""
+    return PassageIndex(text)
+
+
+@traced()
+def answer_question(qa_pipeline, question, text, top_k=TOP_K):
+    """Answers ``question`` from the best ``top_k`` passages of ``text``.
+
+    Returns the reader's answers best first, each with the passage it came
+    from and that passage's retrieval score.
+    """
+    index = get_passage_index(text)
+    # Passages sharing no terms with the question aren't worth a reader pass
+    hits = index.search(question, top_k)
+    hits = [hit for hit in hits if hit[1] > 0] or hits[:1]
+    contexts = [index.passages[passage] for passage, _ in hits]
+    answers = qa_pipeline(question=[question] * len(contexts), context=contexts)
+    if isinstance(answers, dict):
+        answers = [answers]
+
+    results = []
+    for answer, (passage, retrieval_score) in zip(answers, hits):
+        results.append(dict(answer, passage=passage, retrieval_score=retrieval_score))
+    return sorted(results, key=lambda result: result['score'], reverse=True)
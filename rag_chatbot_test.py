@@ -1,20 +1,12 @@
 
 # rag_chatbot_test.py
 
-from transformers import RagTokenizer, RagTokenForGeneration, RagRetriever
-
-# Load the RAG model components
-tokenizer = RagTokenizer.from_pretrained("facebook/rag-token-nq")
-model = RagTokenForGeneration.from_pretrained("facebook/rag-token-nq")
-retriever = RagRetriever.from_pretrained("facebook/rag-token-nq", index_name="exact", use_dummy_dataset=True)
+from rag_engine import get_rag_engine
+from result_cache import content_key
 
 def get_rag_answer(document, question):
-    inputs = tokenizer(question, return_tensors="pt")
-    document_inputs = tokenizer(document, return_tensors="pt")
-
-    with tokenizer.as_target_tokenizer():
-        labels = tokenizer(document, return_tensors="pt").input_ids
-
-    outputs = model.generate(input_ids=inputs["input_ids"], labels=labels, decoder_input_ids=document_inputs["input_ids"])
-    answer = tokenizer.batch_decode(outputs, skip_special_tokens=True)
-    return answer[0]
\ No newline at end of file
+    engine = get_rag_engine()
+    # Index the document once, keyed by its content, then answer from the retrieved passages
+    engine.add_document(document, source=content_key('document', document))
+    answer, _ = engine.answer(question)
+    return answer
\ No newline at end of file
@@ -0,0 +1,380 @@
+
+# rag_engine.py
+
+import json
+import os
+import threading
+
+import numpy as np
+
+from inference_backends import INFERENCE_BACKEND, load_model, load_pipeline
+from question_answering import PASSAGE_OVERLAP, PASSAGE_WORDS
+from result_cache import CACHE_DIR, connect
+from tracing import traced
+
+# Where the passage index of the user's material is kept
+RAG_INDEX_DIR = os.path.join(CACHE_DIR, 'rag_index')
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+GENERATOR_MODEL = "google/flan-t5-base"
+EMBEDDING_BATCH_SIZE = 64
+# Passages retrieved and handed to the generator per question
+RAG_TOP_K = 4
+# Passages embedded and appended at a time while a document streams in
+INDEX_BATCH_PASSAGES = 256
+
+
+class Embedder:
+    """Mean-pooled, normalized sentence embeddings computed in batches on CPU."""
+
+    def __init__(self, model_name=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE, backend=INFERENCE_BACKEND):
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model, self.backend = load_model("feature-extraction", model_name, backend)
+        self.batch_size = batch_size
+        self.dim = self.model.config.hidden_size
+
+    @traced()
+    def embed(self, texts):
+        import torch
+
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        with torch.inference_mode():
+            for start in range(0, len(texts), self.batch_size):
+                batch = self.tokenizer(texts[start:start + self.batch_size], padding=True, truncation=True,
+                                       max_length=256, return_tensors="pt")
+                hidden = self.model(**batch).last_hidden_state
+                mask = batch["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+                pooled = torch.nn.functional.normalize(pooled, dim=1)
+                vectors[start:start + len(pooled)] = pooled.numpy()
+        return vectors
+
+
+class VectorIndex:
+    """Persistent flat inner-product index over a memory-mapped float32 matrix.
+
+    Row ``i`` of ``vectors.f32`` is passage ``i`` in ``passages.sqlite3``.
+    Adding appends rows (growing the file geometrically), deleting marks
+    passages as deleted so their rows are skipped by search. Background jobs
+    in several processes share one index: writers hold SQLite's write lock,
+    and every process re-reads ``meta.json`` before searching or writing.
+    """
+
+    def __init__(self, directory, dim, search_block=65536):
+        self.directory = directory
+        self.dim = dim
+        self.search_block = search_block
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.db_path = os.path.join(directory, "passages.sqlite3")
+
+        with connect(self.db_path) as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS passages (
+                    id INTEGER PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    deleted INTEGER NOT NULL DEFAULT 0
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS passages_source ON passages (source)")
+
+        self.count, self.capacity, self.deletions = 0, 0, 0
+        self.vectors = self._map(0)
+        self.alive = np.ones(0, dtype=bool)
+        self._refresh()
+
+    def _map(self, capacity):
+        if capacity == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _reserve(self, count):
+        if count <= self.capacity:
+            return
+        capacity = max(count, 2 * self.capacity, 1024)
+        if isinstance(self.vectors, np.memmap):
+            self.vectors.flush()
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self.vectors = self._map(capacity)
+        self.alive = np.concatenate([self.alive, np.ones(capacity - self.capacity, dtype=bool)])
+        self.capacity = capacity
+
+    def _save_meta(self):
+        self.vectors.flush()
+        # Replaced in one step, so other processes never read a half-written file
+        with open(self.meta_path + ".tmp", "w") as f:
+            json.dump({"dim": self.dim, "count": self.count, "capacity": self.capacity,
+                       "deletions": self.deletions}, f)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+
+    @staticmethod
+    def _deleted(db):
+        return [row[0] for row in db.execute("SELECT id FROM passages WHERE deleted = 1")]
+
+    def _refresh(self, db=None):
+        """Picks up passages added or deleted by other processes since this one last looked."""
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path) as f:
+            meta = json.load(f)
+        if meta["dim"] != self.dim:
+            raise ValueError(f"Index at {self.directory} has dimension {meta['dim']}, not {self.dim}")
+        deletions = meta.get("deletions", 0)
+        if (meta["count"], meta["capacity"], deletions) == (self.count, self.capacity, self.deletions):
+            return
+        if meta["capacity"] != self.capacity:
+            self.vectors = self._map(meta["capacity"])
+        if db is None:
+            with connect(self.db_path) as db:
+                deleted = self._deleted(db)
+        else:
+            deleted = self._deleted(db)
+        self.alive = np.ones(meta["capacity"], dtype=bool)
+        self.alive[deleted] = False
+        self.count, self.capacity, self.deletions = meta["count"], meta["capacity"], deletions
+
+    def __len__(self):
+        return int(self.alive[:self.count].sum())
+
+    def has_source(self, source):
+        with connect(self.db_path) as db:
+            return db.execute("SELECT 1 FROM passages WHERE source = ? AND deleted = 0 LIMIT 1",
+                              (source,)).fetchone() is not None
+
+    def add(self, texts, vectors, source):
+        """Appends passages and their vectors, returning the new passage ids."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock, connect(self.db_path) as db:
+            # Worker processes index in parallel, the write lock keeps their rows from overlapping
+            db.execute("BEGIN IMMEDIATE")
+            self._refresh(db)
+            start = self.count
+            self._reserve(start + len(vectors))
+            self.vectors[start:start + len(vectors)] = vectors
+            ids = list(range(start, start + len(vectors)))
+            db.executemany("INSERT INTO passages (id, source, text) VALUES (?, ?, ?)",
+                           [(passage_id, source, text) for passage_id, text in zip(ids, texts)])
+            self.count += len(vectors)
+            self._save_meta()
+        return ids
+
+    def delete(self, source):
+        """Removes every passage of ``source`` from search results."""
+        with self._lock, connect(self.db_path) as db:
+            db.execute("BEGIN IMMEDIATE")
+            self._refresh(db)
+            ids = [row[0] for row in db.execute("SELECT id FROM passages WHERE source = ?", (source,))]
+            db.execute("UPDATE passages SET deleted = 1 WHERE source = ?", (source,))
+            self.alive[ids] = False
+            self.deletions += 1
+            self._save_meta()
+        return len(ids)
+
+    def search(self, query_vector, top_k=RAG_TOP_K):
+        """Returns [(passage_id, score)] of the ``top_k`` most similar live passages."""
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        with self._lock:
+            self._refresh()
+        best_ids = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        # Scan the memory map block by block so only one block is paged in at a time
+        for start in range(0, self.count, self.search_block):
+            stop = min(start + self.search_block, self.count)
+            scores = self.vectors[start:stop] @ query_vector
+            scores[~self.alive[start:stop]] = -np.inf
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            best_ids = np.concatenate([best_ids, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+        order = np.argsort(-best_scores, kind="stable")[:top_k]
+        return [(int(best_ids[i]), float(best_scores[i])) for i in order if np.isfinite(best_scores[i])]
+
+    def passages(self, ids):
+        if not ids:
+            return {}
+        with connect(self.db_path) as db:
+            rows = db.execute(f"SELECT id, source, text FROM passages WHERE id IN ({','.join('?' * len(ids))})",
+                              ids).fetchall()
+        return {passage_id: (source, text) for passage_id, source, text in rows}
+
+
+class RagEngine:
+    """Retrieval-augmented answers over the transcripts and documents the user uploaded."""
+
+    def __init__(self, directory=RAG_INDEX_DIR, embedder=None, generator=None):
+        self.embedder = embedder or Embedder()
+        self.index = VectorIndex(directory, self.embedder.dim)
+        self._generator = generator
+
+    @property
+    def generator(self):
+        if self._generator is None:
+            self._generator = load_pipeline("text2text-generation", GENERATOR_MODEL)
+        return self._generator
+
+    @traced()
+    def add_document(self, text, source):
+        """Indexes a document's passages under ``source``, skipping sources already indexed."""
+        return self.add_blocks([text], source)
+
+    @traced()
+    def add_blocks(self, blocks, source):
+        """Indexes a document given as an iterable of text blocks, skipping sources already indexed."""
+        if self.index.has_source(source):
+            return []
+        writer = DocumentWriter(self, source)
+        try:
+            for block in blocks:
+                writer.write(block)
+            return writer.close()
+        except BaseException:
+            # A half-indexed document would count as indexed and never be completed
+            self.index.delete(source)
+            raise
+
+    def remove_document(self, source):
+        return self.index.delete(source)
+
+    @traced()
+    def retrieve(self, question, top_k=RAG_TOP_K):
+        """Returns [{'source', 'text', 'score'}] for the passages most similar to ``question``."""
+        hits = self.index.search(self.embedder.embed([question])[0], top_k)
+        passages = self.index.passages([passage_id for passage_id, _ in hits])
+        return [{"source": passages[passage_id][0], "text": passages[passage_id][1], "score": score}
+                for passage_id, score in hits if passage_id in passages]
+
+    @traced()
+    def answer(self, question, top_k=RAG_TOP_K):
+        """Generates an answer conditioned on the retrieved passages, returning (answer, passages)."""
+        passages = self.retrieve(question, top_k)
+        if not passages:
+            return "", []
+        context = "\n\n".join(passage["text"] for passage in passages)
+        prompt = f"Answer the question using the context.\n\nContext:\n{context}\n\nQuestion: {question}"
+        answer = self.generator(prompt, max_new_tokens=128, truncation=True)[0]["generated_text"]
+        return answer, passages
+
+
+class DocumentWriter:
+    """Adds one document to an engine's index block by block.
+
+    Passages are the same overlapping word windows ``split_passages`` cuts
+    from the whole text, embedded ``batch_passages`` at a time, so a long
+    document is never held or embedded in one piece.
+    """
+
+    def __init__(self, engine, source, passage_words=PASSAGE_WORDS, overlap=PASSAGE_OVERLAP,
+                 batch_passages=INDEX_BATCH_PASSAGES):
+        self.engine = engine
+        self.source = source
+        self.passage_words = passage_words
+        self.step = passage_words - overlap
+        self.overlap = overlap
+        self.batch_passages = batch_passages
+        self.words = []
+        self.passages = []
+        self.windows = 0
+        self.ids = []
+
+    def write(self, block):
+        self.words.extend(block.split())
+        while len(self.words) >= self.passage_words:
+            self.passages.append(" ".join(self.words[:self.passage_words]))
+            self.windows += 1
+            del self.words[:self.step]
+            if len(self.passages) >= self.batch_passages:
+                self.flush()
+
+    def flush(self):
+        if self.passages:
+            vectors = self.engine.embedder.embed(self.passages)
+            self.ids.extend(self.engine.index.add(self.passages, vectors, self.source))
+            self.passages = []
+
+    def close(self):
+        """Indexes the last, shorter window and returns the ids of every passage added."""
+        if len(self.words) > self.overlap or (self.words and not self.windows):
+            self.passages.append(" ".join(self.words))
+        self.words = []
+        self.flush()
+        return self.ids
+
+
+# Shared engine, created on first use so importing this module loads no models
+engine = None
+engine_lock = threading.Lock()
+
+
+def get_rag_engine():
+    global engine
+    with engine_lock:
+        if engine is None:
+            engine = RagEngine()
+    return engine
+
+
+def index_document(text, source):
+    """Adds a transcript or document to the user's RAG library, logging rather than raising on failure."""
+    try:
+        get_rag_engine().add_document(text, source)
+    except Exception as e:
+        print(f"Error indexing {source} for the RAG chatbot: {e}")
+
+
+def index_blocks(blocks, source):
+    """Adds a document given as text blocks to the user's RAG library, logging rather than raising on failure."""
+    try:
+        get_rag_engine().add_blocks(blocks, source)
+    except Exception as e:
+        print(f"Error indexing {source} for the RAG chatbot: {e}")
+
+
+def iter_indexed(blocks, source):
+    """Yields ``blocks`` unchanged, adding them to the RAG library under ``source`` as they pass.
+
+    Lets a background job index a document during the pass it already makes
+    over the extracted text. Indexing errors are logged and stop the
+    indexing, never the caller's pass.
+    """
+    writer = None
+    try:
+        rag_engine = get_rag_engine()
+        if not rag_engine.index.has_source(source):
+            writer = DocumentWriter(rag_engine, source)
+    except Exception as e:
+        print(f"Error indexing {source} for the RAG chatbot: {e}")
+
+    finished = False
+    try:
+        for block in blocks:
+            if writer is not None:
+                try:
+                    writer.write(block)
+                except Exception as e:
+                    print(f"Error indexing {source} for the RAG chatbot: {e}")
+                    remove_partial(writer)
+                    writer = None
+            yield block
+        finished = True
+    finally:
+        # The caller failed or stopped early, so the document was only partly indexed
+        if writer is not None and not finished:
+            remove_partial(writer)
+
+    if writer is not None:
+        try:
+            writer.close()
+        except Exception as e:
+            print(f"Error indexing {source} for the RAG chatbot: {e}")
+            remove_partial(writer)
+
+
+def remove_partial(writer):
+    try:
+        writer.engine.remove_document(writer.source)
+    except Exception as e:
+        print(f"Error removing {writer.source} from the RAG chatbot: {e}")
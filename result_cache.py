@@ -0,0 +1,233 @@
+
+# result_cache.py
+
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Where cached results live, and how much of the disk they may use
+CACHE_DIR = os.environ.get("EDU_ASSIST_CACHE_DIR", ".edu_assist_cache")
+CACHE_MAX_MB = int(os.environ.get("EDU_ASSIST_CACHE_MB", "1024"))
+# Results older than this are recomputed, 0 means they never expire
+CACHE_TTL_SECONDS = int(os.environ.get("EDU_ASSIST_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+@contextmanager
+def connect(db_path):
+    """Opens a SQLite connection that commits on success, rolls back on error and is always closed."""
+    db = sqlite3.connect(db_path, timeout=30)
+    try:
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+def hash_file(path, block_size=1 << 20):
+    """Returns the sha256 hex digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_key(namespace, content, **params):
+    """Builds a cache key from the content being processed and the parameters used.
+
+    ``content`` may be bytes, a string or a list of strings. The namespace
+    stays readable at the front of the key so stats can be grouped by it.
+    """
+    digest = hashlib.sha256()
+    if isinstance(content, (list, tuple)):
+        content = json.dumps(list(content))
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    digest.update(content)
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    return f"{namespace}:{digest.hexdigest()}"
+
+
+class ResultCache:
+    """Persistent SQLite cache of pickled results with TTLs and size-based LRU eviction.
+
+    Files registered with ``add_file`` count against the same size budget and
+    are deleted from disk when evicted, unless ``pin`` holds them for a job
+    that still needs them.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_MB * 1024 * 1024, ttl=CACHE_TTL_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "results.sqlite3")
+        with connect(self.path) as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL,
+                    expires REAL
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            # Uploads and other files written under the directory share the size budget with results
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL,
+                    pins INTEGER NOT NULL DEFAULT 0
+                )""")
+            if "pins" not in [row[1] for row in db.execute("PRAGMA table_info(files)")]:
+                db.execute("ALTER TABLE files ADD COLUMN pins INTEGER NOT NULL DEFAULT 0")
+
+    def get(self, key, default=None):
+        now = time.time()
+        namespace = key.split(':', 1)[0]
+        with connect(self.path) as db:
+            row = db.execute("SELECT value, expires FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] is not None and row[1] < now:
+                db.execute("DELETE FROM results WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses[namespace] += 1
+                return default
+            db.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+        self.hits[namespace] += 1
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, connect(self.path) as db:
+            db.execute("INSERT OR REPLACE INTO results (key, value, size, accessed, expires) VALUES (?, ?, ?, ?, ?)",
+                       (key, blob, len(blob), now, now + ttl if ttl else None))
+            self._evict(db, now)
+
+    def get_or_compute(self, key, compute, ttl=None):
+        """Returns the cached result for ``key``, computing and storing it on a miss."""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value, ttl=ttl)
+        return value
+
+    def _evict(self, db, now, keep=None):
+        db.execute("DELETE FROM results WHERE expires IS NOT NULL AND expires < ?", (now,))
+        total = db.execute("SELECT (SELECT COALESCE(SUM(size), 0) FROM results)"
+                           " + (SELECT COALESCE(SUM(size), 0) FROM files)").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used results and files until we are back under budget
+        entries = db.execute("SELECT 'result', key, size, accessed FROM results"
+                             " UNION ALL SELECT 'file', path, size, accessed FROM files WHERE pins = 0"
+                             " ORDER BY 4").fetchall()
+        for kind, key, size, _ in entries:
+            if key == keep:
+                continue
+            if kind == 'result':
+                db.execute("DELETE FROM results WHERE key = ?", (key,))
+            else:
+                db.execute("DELETE FROM files WHERE path = ?", (key,))
+                try:
+                    os.remove(key)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def add_file(self, path):
+        """Counts a file under the cache directory against the size budget, marking it recently used.
+
+        Returns ``path``. Older results and files are evicted to make room,
+        but never the file just added.
+        """
+        now = time.time()
+        with self._lock, connect(self.path) as db:
+            db.execute("INSERT INTO files (path, size, accessed) VALUES (?, ?, ?)"
+                       " ON CONFLICT (path) DO UPDATE SET size = excluded.size, accessed = excluded.accessed",
+                       (path, os.path.getsize(path), now))
+            self._evict(db, now, keep=path)
+        return path
+
+    def pin(self, path):
+        """Keeps ``path`` from being evicted until a matching ``unpin``. Pins nest."""
+        self.add_file(path)
+        with self._lock, connect(self.path) as db:
+            db.execute("UPDATE files SET pins = pins + 1 WHERE path = ?", (path,))
+
+    def unpin(self, path):
+        with self._lock, connect(self.path) as db:
+            db.execute("UPDATE files SET pins = MAX(pins - 1, 0), accessed = ? WHERE path = ?", (time.time(), path))
+
+    def clear_pins(self):
+        """Releases every pin, for when the jobs holding them are known to be gone."""
+        with self._lock, connect(self.path) as db:
+            db.execute("UPDATE files SET pins = 0")
+
+    def owns(self, path):
+        """Whether ``path`` is an existing file under the cache directory."""
+        directory = os.path.realpath(self.directory)
+        return os.path.isfile(path) and os.path.commonpath([os.path.realpath(path), directory]) == directory
+
+    def file_path(self, key, suffix, folder):
+        """Returns a path under the cache directory for a file derived from cache ``key``."""
+        directory = os.path.join(self.directory, folder)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, key.split(':', 1)[-1] + suffix)
+
+    def upload_path(self, content, suffix, digest=None):
+        """Returns a content-addressed path for an uploaded file, writing it if new.
+
+        Identical uploads share one file and different uploads never overwrite
+        each other, unlike a fixed temporary file name. Pass the content's
+        sha256 hex ``digest`` if it is already known.
+        """
+        directory = os.path.join(self.directory, "uploads")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, (digest or hashlib.sha256(content).hexdigest()) + suffix)
+        if not os.path.exists(path):
+            # Write under a unique name first so concurrent uploads never see a partial file
+            partial = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+            with open(partial, 'wb') as f:
+                f.write(content)
+            os.replace(partial, path)
+        return self.add_file(path)
+
+    def delete(self, key):
+        with connect(self.path) as db:
+            db.execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def clear(self):
+        with connect(self.path) as db:
+            db.execute("DELETE FROM results")
+
+    def stats(self):
+        with connect(self.path) as db:
+            entries, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+            files, file_size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files").fetchone()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "files": files,
+            "file_bytes": file_size,
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+        }
+
+
+cache = ResultCache()
@@ -1,29 +1,70 @@
 
 # streamlit_app.py
 
+import hashlib
+import os
+import time
+
 import streamlit as st
 
-from transformers import pipeline
-
-from topic_identification import build_lda_model
-from video_to_audio_to_text import convert_video_to_audio, audio_to_text, save_text
-from text_summarization import (
-    extract_text_from_pdf,
-    extract_text_from_docx,
-    text_rank_summarize,
-    extract_keywords,
-    display_named_entities,
-    translate_text,
-    detect_language,
-    MODELS
-)
+from video_to_audio_to_text import NATIVE_SAMPLE_RATE, save_text
+from text_summarization import MODELS
+from translation import detect_language, translate_text
+from document_extraction import DOCX_TYPE, PDF_TYPE
+from model_registry import print_metrics
+from inference_backends import load_qa_pipeline
+from inference_server import QAServer
+from job_queue import JobQueue
+from question_answering import answer_question
+from rag_engine import get_rag_engine
+from result_cache import cache, content_key
+
+# Report spaCy cold starts and memory once per process, not once per rerun
+if print_metrics not in MODELS.metrics_hooks:
+    MODELS.add_metrics_hook(print_metrics)
 
 #Load CSS
 with open("styles.css") as f:
     st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
 
+# Concurrent speech recognition requests per transcription
+TRANSCRIPTION_WORKERS = 4
+
+# Seconds between status checks while a background job runs
+POLL_SECONDS = 1.0
+
+@st.cache_resource
+def get_job_queue():
+    # One job queue per server process, shared by every session
+    return JobQueue()
+
+
+def poll_job(job_id, label):
+    """Shows a background job's progress and returns its result once done.
+
+    While the job runs the script sleeps briefly and reruns itself, so other
+    widgets stay responsive and the job is never restarted.
+    """
+    jobs = get_job_queue()
+    status = jobs.status(job_id)
+    if status is None:
+        st.error(f"{label} job not found.")
+        return None
+    if status["status"] == "done":
+        return jobs.result(job_id)
+    if status["status"] == "failed":
+        st.error(f"{label} failed: {status['error']}")
+        return None
+    st.progress(status["progress"], text=f"{label}... {status['message']}")
+    time.sleep(POLL_SECONDS)
+    st.rerun()
+
+
 #RagChatBot
-qa_pipeline = pipeline("question-answering")
+@st.cache_resource
+def get_qa_server():
+    # One model per process, shared by every session and fed in micro-batches
+    return QAServer(load_qa_pipeline())
 
 
 def video_transcription_page():
@@ -32,28 +73,45 @@ def video_transcription_page():
 
     # Only proceed if a video has been uploaded
     if uploaded_video is not None:
-        # Save the uploaded video to a temporary file
-        temp_video_file = "temp_video.mp4"
-        try:
-            with open(temp_video_file, "wb") as f:
-                f.write(uploaded_video.read())
-            # Commented out the success message for uploading to keep the UI clean
-            # st.success("Video successfully uploaded and saved to temporary file.")
-        except Exception as e:
-            st.error(f"Failed to save the uploaded video: {e}")
-            return
-        
-        # Convert video to audio and transcribe
-        try:
-            audio_file_path = convert_video_to_audio(temp_video_file)
-            # Commented out the success message for conversion to keep the UI clean
-            # st.success(f"Video converted to audio: {audio_file_path}")
-        except Exception as e:
-            st.error(f"Failed to convert video to audio: {e}")
-            return
+        # The page reruns every second while transcribing, so a video is hashed and saved once per upload
+        video_uploads = st.session_state.setdefault('video_uploads', {})
+        if uploaded_video.file_id not in video_uploads:
+            video_bytes = uploaded_video.getvalue()
+            digest = hashlib.sha256(video_bytes).hexdigest()
+            try:
+                # Saved under a name derived from its content so concurrent users never collide
+                path = cache.upload_path(video_bytes, os.path.splitext(uploaded_video.name)[1] or ".mp4", digest)
+                # Commented out the success message for uploading to keep the UI clean
+                # st.success("Video successfully uploaded and saved to temporary file.")
+            except Exception as e:
+                st.error(f"Failed to save the uploaded video: {e}")
+                return
+            video_uploads[uploaded_video.file_id] = (digest, path)
+        digest, temp_video_file = video_uploads[uploaded_video.file_id]
+
+        # The same lecture uploaded again is answered straight from the cache
+        transcript_key = content_key("video_transcript", digest, sample_rate=NATIVE_SAMPLE_RATE, language_code="en-US")
+        transcribed_text = cache.get(transcript_key)
+
+        if transcribed_text is None:
+            # Transcription runs in a background worker, submitted once per upload. A failed job
+            # is only started again from the Retry button, since every attempt is billed
+            transcription_jobs = st.session_state.setdefault('transcription_jobs', {})
+            if transcript_key not in transcription_jobs:
+                transcription_jobs[transcript_key] = get_job_queue().submit(
+                    "transcription", video_file_path=temp_video_file, max_workers=TRANSCRIPTION_WORKERS)
+            transcribed_text = poll_job(transcription_jobs[transcript_key], "Transcribing")
+            if transcribed_text is None:
+                if st.button("Retry transcription"):
+                    # Saved again on the rerun, in case the cache evicted it meanwhile
+                    del transcription_jobs[transcript_key], video_uploads[uploaded_video.file_id]
+                    st.rerun()
+                return
+            if transcribed_text:
+                # The job has already indexed the lecture for the RAG chatbot
+                cache.set(transcript_key, transcribed_text)
 
         try:
-            transcribed_text = audio_to_text(audio_file_path)
             if transcribed_text:
                 # st.success("Audio successfully transcribed.")  # Also commented out
                 st.text_area("Transcribed Text", transcribed_text, height=300)
@@ -75,6 +133,7 @@ And if there's something you're not quite clear on, just ask our RAG chatbot for
                 # This step can be made optional or removed to keep the UI focused on transcription results.
                 output_file_path = temp_video_file.rsplit('.', 1)[0] + '_transcribed_text.txt'
                 save_text(transcribed_text, output_file_path)
+                cache.add_file(output_file_path)
                 # st.success(f"Transcribed text saved to {output_file_path}")  # Consider removing or making this optional based on user action
             else:
                 st.error("Transcription failed. No text was returned.")
@@ -131,41 +190,46 @@ Plus, translate it into another language if you need to!
         text_input = st.text_area("Paste text here:", height=100)
         uploaded_file = st.file_uploader("Or upload a file (.txt, .pdf, .docx):", type=["txt", "pdf", "docx"])
 
-        # Handle file upload
-        if uploaded_file is not None:
-            # Extract text from the uploaded file here and assign it to text_input
-            if uploaded_file.type == "application/pdf":
-                text_input = extract_text_from_pdf(uploaded_file)
-            elif uploaded_file.type == "text/plain":
-                text_input = str(uploaded_file.read(), "utf-8")
-            elif uploaded_file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                text_input = extract_text_from_docx(uploaded_file)
+        # Handle file upload. PDF and DOCX files are only extracted by the summarize job, page by page
+        if uploaded_file is not None and uploaded_file.type == "text/plain":
+            text_input = str(uploaded_file.getvalue(), "utf-8")
 
         # When the button is clicked, generate the summary and other features and save to session_state
         if st.button("Summarize Text"):
-            if text_input:
+            if uploaded_file is not None and uploaded_file.type in (PDF_TYPE, DOCX_TYPE):
+                # The worker streams the file page by page, detecting its language from the first pages
+                suffix = ".pdf" if uploaded_file.type == PDF_TYPE else ".docx"
+                st.session_state['summary_job'] = get_job_queue().submit(
+                    "summarize_file", path=cache.upload_path(uploaded_file.getvalue(), suffix),
+                    file_type=uploaded_file.type, n_sentences=3)
+            elif text_input:
                 language = detect_language(text_input)
                 if language and language in MODELS:
-                    nlp_model = MODELS[language]
-                    st.session_state['summary'] = text_rank_summarize(text_input, nlp_model, n_sentences=3)
-                    st.session_state['keywords'] = extract_keywords(nlp_model, text_input)
-                    st.session_state['entities'] = display_named_entities(nlp_model, text_input)
-                    
-                    st.write("Summary:")
-                    st.write(st.session_state['summary'])
-                    st.write("Keywords:")
-                    st.write(", ".join([keyword for keyword, _ in st.session_state['keywords']]))
-                    st.write("Named Entities:")
-                    st.write(", ".join([f"{text} ({label})" for text, label in st.session_state['entities']]))
+                    # Parsing runs in a background worker, the job ID survives reruns
+                    st.session_state['summary_job'] = get_job_queue().submit(
+                        "summarize", text_input=text_input, language=language, n_sentences=3)
                 else:
                     st.error("Language not supported or text is too short to detect language.")
             else:
                 st.error("Please input text or upload a file to summarize.")
 
+        if st.session_state.get('summary_job'):
+            insights = poll_job(st.session_state['summary_job'], "Summarizing")
+            if insights is not None:
+                st.session_state['summary'], st.session_state['keywords'], st.session_state['entities'] = insights
+
+                st.write("Summary:")
+                st.write(st.session_state['summary'])
+                st.write("Keywords:")
+                st.write(", ".join([keyword for keyword, _ in st.session_state['keywords']]))
+                st.write("Named Entities:")
+                st.write(", ".join([f"{text} ({label})" for text, label in st.session_state['entities']]))
+
         # Translation of the summarized text
         if st.session_state['summary']:
             if st.checkbox("Translate Summary"):
                 target_language = st.selectbox("Select target language:", ["English", "Spanish", "French", "German", "Portuguese"], index=0)
+                # Reruns with the box ticked are answered from the translation memory, not the service
                 translation = translate_text(st.session_state['summary'], target_language)
                 st.write("Translated Text:")
                 st.write(translation)
@@ -212,12 +276,18 @@ It's like having a personal assistant to help you pinpoint what's important in y
             if not documents:
                 st.warning("Please upload a file or paste text to analyze.")
             else:
-                # Process the documents to identify topics
-                lda_model, id2word, corpus = build_lda_model(documents, num_topics=num_topics)
-                
+                # An uploaded corpus keeps its model, so lines appended later are folded in incrementally
+                corpus_id = content_key(uploaded_file.name, documents[:1]) if uploaded_file is not None else None
+
+                # Process the documents to identify topics in a background worker
+                st.session_state['topics_job'] = get_job_queue().submit(
+                    "topics", documents=documents, num_topics=num_topics, corpus_id=corpus_id)
+
+        if st.session_state.get('topics_job'):
+            topics = poll_job(st.session_state['topics_job'], "Discovering topics")
+            if topics is not None:
                 # Display the identified topics and their top words
                 st.write("Identified Topics and Top Words:")
-                topics = lda_model.show_topics(formatted=True, num_topics=num_topics, num_words=10)
                 for topic in topics:
                     st.write(topic)
                     
@@ -261,9 +331,23 @@ No more confusion, no more unanswered questions. Let's make learning easy and fu
         
         if st.button("Find Your Answer"):
             if user_text and user_question:
-                # Generate answer
-                result = qa_pipeline(question=user_question, context=user_text)
-                st.write("Answer:", result['answer'])
+                # Only the passages most relevant to the question go through the reader model
+                results = answer_question(get_qa_server(), user_question, user_text)
+                st.write("Answer:", results[0]['answer'])
+                if len(results) > 1:
+                    with st.expander("Other candidate answers"):
+                        for result in results[1:]:
+                            st.write(f"{result['answer']} (score {result['score']:.2f})")
+            elif user_question:
+                # Without a snippet, answer from every transcript and document uploaded so far
+                answer, passages = get_rag_engine().answer(user_question)
+                if passages:
+                    st.write("Answer:", answer)
+                    with st.expander("Sources"):
+                        for passage in passages:
+                            st.write(passage['text'][:300] + "...")
+                else:
+                    st.write("Upload some study material first, or share a text snippet.")
         else:
             st.write("Please provide both the text and a question.")
         
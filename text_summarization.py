@@ -1,91 +1,446 @@
 
 # text_summarization.py
 
-from langdetect import detect
-import spacy
-import networkx as nx
-from googletrans import Translator
-from collections import Counter
-
-import fitz  # PyMuPDF
-from docx import Document
-
-# Ensure spaCy models for desired languages are downloaded
-MODEL_NAMES = {
-    'en': 'en_core_web_sm',
-    'es': 'es_core_news_sm',
-    'fr': 'fr_core_news_sm',
-    'de': 'de_core_news_sm',
-    'pt': 'pt_core_news_sm',
-}
-
-MODELS = {lang: spacy.load(name) for lang, name in MODEL_NAMES.items()}
-
-translator = Translator()
-
-def detect_language(text):
-    try:
-        return detect(text)
-    except Exception as e:
-        print(f"Error detecting language: {e}")
-        return None
+import numpy as np
+from scipy import sparse
+from collections import Counter, deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import multiprocessing
+import os
+import time
 
-def text_rank_summarize(text, nlp_model, n_sentences=3):
-    doc = nlp_model(text)
-    sentences = [sent for sent in doc.sents]
-    sentence_vectors = [nlp_model(sent.text).vector for sent in sentences]
-
-    similarity_matrix = nx.Graph()
-    for i, vector in enumerate(sentence_vectors):
-        for j, other_vector in enumerate(sentence_vectors):
-            if i != j:
-                similarity = vector @ other_vector
-                if similarity > 0.5:
-                    similarity_matrix.add_edge(i, j, weight=similarity)
-
-    scores = nx.pagerank(similarity_matrix)
-    ranked_sentences = sorted(scores, key=scores.get, reverse=True)
-    summary = " ".join(sentences[idx].text for idx in ranked_sentences[:n_sentences])
-    return summary
+from document_extraction import PDF_TYPE, iter_docx_blocks, iter_document, iter_pdf_pages, pdf_page_count
+from model_registry import MODEL_NAMES, registry
+from rag_engine import index_blocks, index_document, iter_indexed
+from result_cache import cache, content_key, hash_file
+from tracing import annotate, span, traced
+from translation import detect_language, translate_text
 
-def extract_keywords(nlp_model, text, num_keywords=10):
-    doc = nlp_model(text)
+# Pipelines are loaded lazily on first use and shared with the other modules
+MODELS = registry
+
+# Components each single-purpose helper can skip
+SUMMARY_DISABLE = ['ner']
+KEYWORDS_DISABLE = ['parser', 'ner']
+ENTITIES_DISABLE = ['tagger', 'morphologizer', 'parser', 'attribute_ruler', 'lemmatizer']
+
+# Blocks of a streamed document read before its language is detected
+DETECT_BLOCKS = 3
+# Streamed blocks handed to nlp.pipe at a time
+STREAM_BATCH_SIZE = 8
+
+# Hierarchical summarization: sections are well under spaCy's max_length (1,000,000 characters)
+SECTION_CHARS = 100000
+# Texts longer than this are summarized section by section
+HIERARCHICAL_MIN_CHARS = 500000
+HIERARCHICAL_MIN_PAGES = 200
+SECTION_WORKERS = min(4, os.cpu_count() or 1)
+# Sentences each section contributes to the final TextRank pass
+SECTION_SENTENCES = 5
+# Keyword counts kept per section and across sections, which bounds memory for any input length
+SECTION_KEYWORDS = 200
+MERGED_KEYWORDS = 2000
+# Entities kept across sections, the ones found in the most sections win
+MERGED_ENTITIES = 5000
+# Candidate sentences are ranked down to half this many whenever they exceed it
+MAX_CANDIDATES = 2000
+
+# Result of summarizing one section in a worker process
+SectionSummary = namedtuple("SectionSummary", ["index", "sentences", "vectors", "noun_counts", "entities", "seconds"])
+
+# Result of hierarchical summarization with the wall time of each stage
+HierarchicalSummary = namedtuple("HierarchicalSummary", ["summary", "keywords", "entities", "sections", "timings"])
+
+def sentence_similarity_matrix(sentence_vectors, threshold=0.5, block_size=1024):
+    """Builds a sparse matrix of cosine similarities above ``threshold``.
+
+    Similarities are computed one block of rows at a time so that only a
+    ``block_size x n`` dense slice is ever held in memory.
+    """
+    vectors = np.asarray(sentence_vectors, dtype=np.float32)
+    n = vectors.shape[0]
+    if n == 0:
+        return sparse.csr_matrix((0, 0), dtype=np.float32)
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    normalized = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+    blocks = []
+    for start in range(0, n, block_size):
+        similarities = normalized[start:start + block_size] @ normalized.T
+        # A sentence is never linked to itself
+        rows = np.arange(similarities.shape[0])
+        similarities[rows, rows + start] = 0.0
+        similarities[similarities <= threshold] = 0.0
+        blocks.append(sparse.csr_matrix(similarities))
+    return sparse.vstack(blocks, format="csr")
+
+def pagerank(matrix, alpha=0.85, max_iter=100, tol=1.0e-6):
+    """Weighted PageRank by power iteration, matching networkx's defaults."""
+    n = matrix.shape[0]
+    if n == 0:
+        return np.zeros(0)
+
+    out_weight = np.asarray(matrix.sum(axis=1)).ravel()
+    dangling = out_weight == 0
+    inverse = np.divide(1.0, out_weight, out=np.zeros_like(out_weight), where=~dangling)
+    transition = (sparse.diags(inverse) @ matrix).T.tocsr()
+
+    scores = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        previous = scores
+        # Dangling sentences spread their score evenly over the whole document
+        scores = alpha * (transition @ previous + previous[dangling].sum() / n) + (1 - alpha) / n
+        if np.abs(scores - previous).sum() < n * tol:
+            break
+    return scores
+
+@traced()
+def rank_vectors(sentence_vectors, n_sentences=3):
+    """Returns the indices of the ``n_sentences`` most central sentence vectors."""
+    if len(sentence_vectors) == 0:
+        return []
+    scores = pagerank(sentence_similarity_matrix(sentence_vectors))
+    return list(np.argsort(-scores, kind="stable")[:n_sentences])
+
+def rank_sentences(sentences, n_sentences=3):
+    """Returns the indices of the ``n_sentences`` most central sentences."""
+    return rank_vectors([sent.vector for sent in sentences], n_sentences)
+
+@traced()
+def summarize_doc(doc, n_sentences=3):
+    # Sentence vectors come from the existing parse, no need to run the model again
+    sentences = list(doc.sents)
+    ranked_sentences = rank_sentences(sentences, n_sentences)
+    return " ".join(sentences[idx].text for idx in ranked_sentences)
+
+@traced()
+def doc_keywords(doc, num_keywords=10):
     nouns = [token.text.lower() for token in doc if token.pos_ in ["NOUN", "PROPN"]]
-    noun_freq = Counter(nouns)
-    keywords = noun_freq.most_common(num_keywords)
-    return keywords
+    return Counter(nouns).most_common(num_keywords)
 
-def display_named_entities(nlp_model, text):
-    doc = nlp_model(text)
+@traced()
+def doc_entities(doc):
     unique_entities = set((ent.text, ent.label_) for ent in doc.ents)
     return sorted(list(unique_entities), key=lambda x: x[0])
 
-def translate_text(text, dest_language):
-    translation = translator.translate(text, dest=dest_language)
-    return translation.text
+class DocumentAnalysis:
+    """Parses a document once and derives the summary, keywords and entities from that Doc.
+
+    ``parser_passes`` counts how many times the spaCy pipeline ran for this
+    document, which should stay at 1 however many results are requested.
+    Pass ``disable`` to skip pipeline components none of the results need.
+    """
+
+    def __init__(self, text, nlp_model, disable=()):
+        self.text = text
+        self.nlp_model = nlp_model
+        self.disable = list(disable)
+        self.parser_passes = 0
+        self._doc = None
+
+    @property
+    def doc(self):
+        if self._doc is None:
+            with span("text_summarization.parse", chars=len(self.text)):
+                self._doc = self.nlp_model(self.text, disable=self.disable)
+            self.parser_passes += 1
+        return self._doc
+
+    def summary(self, n_sentences=3):
+        return summarize_doc(self.doc, n_sentences=n_sentences)
+
+    def keywords(self, num_keywords=10):
+        return doc_keywords(self.doc, num_keywords=num_keywords)
+
+    def entities(self):
+        return doc_entities(self.doc)
+
+class StreamingAnalysis:
+    """Summary, keywords and entities of a document consumed block by block.
+
+    Blocks (PDF pages, groups of DOCX paragraphs) are parsed as they arrive
+    and only what the results need is kept: sentence texts and vectors, noun
+    counts and the entity set. Neither the full text nor its Docs are ever
+    held at once. Sentences are not joined across block boundaries.
+    """
+
+    def __init__(self, nlp_model, batch_size=STREAM_BATCH_SIZE):
+        self.nlp_model = nlp_model
+        self.batch_size = batch_size
+        self.sentences = []
+        self.sentence_vectors = []
+        self.noun_counts = Counter()
+        self.entity_set = set()
+        self.blocks = 0
+
+    def add_doc(self, doc):
+        for sent in doc.sents:
+            self.sentences.append(sent.text)
+            self.sentence_vectors.append(sent.vector.astype(np.float32))
+        self.noun_counts.update(token.text.lower() for token in doc if token.pos_ in ["NOUN", "PROPN"])
+        self.entity_set.update((ent.text, ent.label_) for ent in doc.ents)
+        self.blocks += 1
+
+    @traced()
+    def feed(self, blocks, progress=None):
+        """Parses each block of ``blocks`` as it is produced, calling ``progress(blocks_done)``."""
+        for doc in self.nlp_model.pipe(blocks, batch_size=self.batch_size):
+            self.add_doc(doc)
+            if progress is not None:
+                progress(self.blocks)
+        annotate(blocks=self.blocks, sentences=len(self.sentences))
+        return self
+
+    def summary(self, n_sentences=3):
+        ranked_sentences = rank_vectors(self.sentence_vectors, n_sentences)
+        return " ".join(self.sentences[idx] for idx in ranked_sentences)
+
+    def keywords(self, num_keywords=10):
+        return self.noun_counts.most_common(num_keywords)
+
+    def entities(self):
+        return sorted(self.entity_set, key=lambda x: x[0])
 
+def text_rank_summarize(text, nlp_model, n_sentences=3):
+    if len(text) > HIERARCHICAL_MIN_CHARS and nlp_model.lang in MODEL_NAMES:
+        # One parse of the whole text would exceed spaCy's max_length and a quadratic sentence graph
+        return hierarchical_summarize(text, nlp_model.lang, n_sentences).summary
+    return DocumentAnalysis(text, nlp_model, disable=SUMMARY_DISABLE).summary(n_sentences)
+
+def extract_keywords(nlp_model, text, num_keywords=10):
+    return DocumentAnalysis(text, nlp_model, disable=KEYWORDS_DISABLE).keywords(num_keywords)
+
+def display_named_entities(nlp_model, text):
+    return DocumentAnalysis(text, nlp_model, disable=ENTITIES_DISABLE).entities()
 
+
+@traced()
 def extract_text_from_pdf(pdf_content):
-    text = ""
-    with fitz.open(stream=pdf_content, filetype="pdf") as doc:
-        for page in doc:
-            text += page.get_text()
-    return text
+    # Joining once is linear, adding page by page copied the text so far every time
+    return "".join(iter_pdf_pages(pdf_content))
 
+@traced()
 def extract_text_from_docx(docx_content):
-    text = ""
-    doc = Document(docx_content)
-    for para in doc.paragraphs:
-        text += para.text + '\n'
-    return text.strip()
+    return "\n".join(iter_docx_blocks(docx_content)).strip()
 
-def summarize_text(text_input, num_sentences=3):
+def analyze_text(text_input):
     # Detecting the language of the text
     language = detect_language(text_input)
     if not language or language not in MODELS:
         raise Exception("Unsupported language or language could not be detected.")
 
-    nlp_model = MODELS[language]
-    # Using the existing text_rank_summarize function
-    summary = text_rank_summarize(text_input, nlp_model, n_sentences=num_sentences)
-    return summary
\ No newline at end of file
+    return DocumentAnalysis(text_input, MODELS[language])
+
+@traced()
+def document_insights(text_input, language, n_sentences=3, num_keywords=10):
+    """Returns (summary, keywords, entities) for a document, served from the result cache when possible."""
+    key = content_key('insights', text_input, language=language, n_sentences=n_sentences, num_keywords=num_keywords)
+
+    def compute():
+        if len(text_input) > HIERARCHICAL_MIN_CHARS:
+            result = hierarchical_summarize(text_input, language, n_sentences, num_keywords)
+            return result.summary, result.keywords, result.entities
+        analysis = DocumentAnalysis(text_input, MODELS[language])
+        insights = (analysis.summary(n_sentences=n_sentences), analysis.keywords(num_keywords), analysis.entities())
+        annotate(parser_passes=analysis.parser_passes)
+        return insights
+
+    # A cached result costs no parser pass at all
+    annotate(parser_passes=0)
+    return cache.get_or_compute(key, compute)
+
+def insights_job(text_input, language, n_sentences=3, progress=None):
+    """Background job: returns (summary, keywords, entities) for a document and indexes it for the RAG chatbot."""
+    insights = document_insights(text_input, language, n_sentences=n_sentences)
+    index_document(text_input, source=content_key('document', text_input))
+    return insights
+
+@traced()
+def iter_sections(blocks, section_chars=SECTION_CHARS):
+    """Groups text blocks into sections of at most ``section_chars`` characters, split on line boundaries."""
+    if isinstance(blocks, str):
+        blocks = [blocks]
+    section, size = [], 0
+    for block in blocks:
+        for line in block.splitlines(keepends=True):
+            # A single overlong line is cut at the last space before the limit
+            while len(line) > section_chars:
+                cut = line.rfind(" ", 0, section_chars) + 1 or section_chars
+                if section:
+                    yield "".join(section)
+                    section, size = [], 0
+                yield line[:cut]
+                line = line[cut:]
+            if size + len(line) > section_chars and section:
+                yield "".join(section)
+                section, size = [], 0
+            section.append(line)
+            size += len(line)
+    if section:
+        yield "".join(section)
+
+@traced()
+def summarize_section(index, section, language, n_sentences=SECTION_SENTENCES):
+    """Map stage: parses one section and keeps its top sentences, keyword counts and entities."""
+    start = time.perf_counter()
+    doc = MODELS[language](section)
+    sentences = list(doc.sents)
+    ranked_sentences = rank_sentences(sentences, n_sentences)
+    noun_counts = Counter(token.text.lower() for token in doc if token.pos_ in ["NOUN", "PROPN"])
+    return SectionSummary(index,
+                          [sentences[idx].text for idx in ranked_sentences],
+                          [sentences[idx].vector.astype(np.float32) for idx in ranked_sentences],
+                          dict(noun_counts.most_common(SECTION_KEYWORDS)),
+                          set((ent.text, ent.label_) for ent in doc.ents),
+                          time.perf_counter() - start)
+
+def iter_section_summaries(sections, language, workers, n_sentences):
+    """Yields section summaries in order, summarizing up to ``workers`` sections at once."""
+    if workers <= 1:
+        for index, section in enumerate(sections):
+            yield summarize_section(index, section, language, n_sentences)
+        return
+
+    # Each worker loads the language's pipeline once, only a couple of sections per worker are in memory
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = deque()
+        for index, section in enumerate(sections):
+            pending.append(pool.submit(summarize_section, index, section, language, n_sentences))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+@traced()
+def hierarchical_summarize(blocks, language, n_sentences=3, num_keywords=10, workers=SECTION_WORKERS,
+                           section_chars=SECTION_CHARS, section_sentences=SECTION_SENTENCES, progress=None):
+    """Map-reduce summary of a document of any length, given as a string or an iterable of text blocks.
+
+    Sections are summarized in worker processes (map), TextRank runs again
+    over the sentences the sections kept (reduce), and keyword counts and
+    entities of all sections are merged. Returns a ``HierarchicalSummary``
+    whose ``timings`` holds the wall time of each stage in seconds, also
+    recorded on its tracing span; the sections are split lazily while the
+    map stage runs, so its time includes the split.
+    """
+    timings = {}
+    start = time.perf_counter()
+    candidates, candidate_vectors = [], []
+    seen = set()
+    noun_counts = Counter()
+    entity_counts = Counter()
+    sections = 0
+    section_seconds = 0.0
+    merge_seconds = 0.0
+    for result in iter_section_summaries(iter_sections(blocks, section_chars), language, workers, section_sentences):
+        merge_start = time.perf_counter()
+        for sentence, vector in zip(result.sentences, result.vectors):
+            # Sections often repeat a sentence (headers, definitions), it should count once
+            if sentence not in seen:
+                seen.add(sentence)
+                candidates.append(sentence)
+                candidate_vectors.append(vector)
+        noun_counts.update(result.noun_counts)
+        if len(noun_counts) > MERGED_KEYWORDS:
+            noun_counts = Counter(dict(noun_counts.most_common(MERGED_KEYWORDS // 2)))
+        entity_counts.update(result.entities)
+        if len(entity_counts) > MERGED_ENTITIES:
+            entity_counts = Counter(dict(entity_counts.most_common(MERGED_ENTITIES // 2)))
+        if len(candidates) > MAX_CANDIDATES:
+            # Rank the candidates down early so the reduce graph never grows past MAX_CANDIDATES
+            keep = sorted(rank_vectors(candidate_vectors, MAX_CANDIDATES // 2))
+            candidates = [candidates[idx] for idx in keep]
+            candidate_vectors = [candidate_vectors[idx] for idx in keep]
+            seen = set(candidates)
+        merge_seconds += time.perf_counter() - merge_start
+        sections += 1
+        section_seconds += result.seconds
+        if progress is not None:
+            progress(sections)
+    timings['map'] = time.perf_counter() - start - merge_seconds
+    timings['map_worker_seconds'] = section_seconds
+    timings['merge'] = merge_seconds
+
+    reduce_start = time.perf_counter()
+    ranked_sentences = rank_vectors(candidate_vectors, n_sentences)
+    summary = " ".join(candidates[idx] for idx in ranked_sentences)
+    timings['reduce'] = time.perf_counter() - reduce_start
+    timings['total'] = time.perf_counter() - start
+    annotate(sections=sections, timings=timings)
+
+    return HierarchicalSummary(summary, noun_counts.most_common(num_keywords),
+                               sorted(entity_counts, key=lambda x: x[0]), sections, timings)
+
+def stream_language(blocks, language=None):
+    """Returns (language, blocks), detecting the language from the first blocks if not given.
+
+    The blocks read for detection are put back in front of the rest.
+    """
+    blocks = iter(blocks)
+    if language is None:
+        head = list(itertools.islice(blocks, DETECT_BLOCKS))
+        language = detect_language(" ".join(head))
+        blocks = itertools.chain(head, blocks)
+    if not language or language not in MODELS:
+        raise Exception("Unsupported language or language could not be detected.")
+    return language, blocks
+
+@traced()
+def stream_insights(blocks, language=None, n_sentences=3, num_keywords=10, progress=None):
+    """Returns (summary, keywords, entities) for a document given as an iterable of text blocks.
+
+    Blocks are consumed as they are produced, so extraction and parsing
+    overlap. The language is detected from the first few blocks if not given.
+    """
+    language, blocks = stream_language(blocks, language)
+    analysis = StreamingAnalysis(MODELS[language]).feed(blocks, progress)
+    return analysis.summary(n_sentences=n_sentences), analysis.keywords(num_keywords), analysis.entities()
+
+@traced()
+def file_insights_job(path, file_type, language=None, n_sentences=3, num_keywords=10, progress=None):
+    """Background job: streams an uploaded file through the analysis, reporting progress per page or block.
+
+    The extracted blocks are indexed for the RAG chatbot on the same pass.
+    """
+    digest = hash_file(path)
+    key = content_key('file_insights', digest, file_type=file_type, language=language,
+                      n_sentences=n_sentences, num_keywords=num_keywords)
+    source = content_key('document', digest)
+    blocks = iter_indexed(iter_document(path, file_type), source)
+    total = pdf_page_count(path) if file_type == PDF_TYPE else None
+
+    def report(done):
+        if progress is not None:
+            if total:
+                progress(min(done / total, 1.0), f"page {done}/{total}")
+            else:
+                progress(0.0, f"{done} blocks")
+
+    def counted(blocks):
+        # The hierarchical path reads blocks through its section splitter, count them as they pass
+        for done, block in enumerate(blocks, 1):
+            yield block
+            report(done)
+
+    if (total or 0) >= HIERARCHICAL_MIN_PAGES or (total is None and os.path.getsize(path) > HIERARCHICAL_MIN_CHARS):
+        insights = cache.get_or_compute(key, lambda: hierarchical_file_insights(counted(blocks), language,
+                                                                                n_sentences, num_keywords))
+    else:
+        insights = cache.get_or_compute(key, lambda: stream_insights(blocks, language, n_sentences, num_keywords,
+                                                                     report))
+    # A cached result never reads the file, extract it again only if the chatbot doesn't have it yet
+    index_blocks(iter_document(path, file_type), source)
+    return insights
+
+def hierarchical_file_insights(blocks, language, n_sentences, num_keywords):
+    """Summarizes a long file section by section while its pages are still being extracted."""
+    language, blocks = stream_language(blocks, language)
+    result = hierarchical_summarize(blocks, language, n_sentences, num_keywords)
+    return result.summary, result.keywords, result.entities
+
+@traced()
+def summarize_text(text_input, num_sentences=3):
+    key = content_key('summary', text_input, n_sentences=num_sentences)
+    return cache.get_or_compute(key, lambda: analyze_text(text_input).summary(n_sentences=num_sentences))
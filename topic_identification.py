@@ -1,30 +1,78 @@
 
 # topic_identification.py
 
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import threading
+
 import gensim.corpora as corpora
-from gensim.models import LdaModel
+from gensim.models import LdaModel, LdaMulticore
 from nltk.corpus import stopwords
-import spacy
 import nltk
+import numpy as np
+
+from model_registry import get_model
+from result_cache import CACHE_DIR, cache, content_key
+from tracing import traced
 
 # Download stopwords from NLTK
 nltk.download('stopwords')
 
-# Load spacy model for lemmatization
-nlp = spacy.load('en_core_web_sm', disable=['parser', 'ner'])
+# Lemmatization only needs the tagger, the shared English pipeline runs without these
+LEMMATIZE_DISABLE = ['parser', 'ner']
+
+# Documents per nlp.pipe batch and worker processes for preprocessing
+PREPROCESS_BATCH_SIZE = 256
+PREPROCESS_PROCESSES = 1
+
+def iter_preprocessed(documents, batch_size=PREPROCESS_BATCH_SIZE, n_process=PREPROCESS_PROCESSES):
+    """Streams documents through nlp.pipe, yielding the lemmas kept for each one."""
+    stop_words = set(stopwords.words('english'))
+    nlp = get_model('en')
+    for doc in nlp.pipe(documents, batch_size=batch_size, n_process=n_process, disable=LEMMATIZE_DISABLE):
+        yield [token.lemma_ for token in doc if token.lemma_.isalpha() and token.lemma_ not in stop_words]
+
+@traced()
+def preprocess_texts(documents, batch_size=PREPROCESS_BATCH_SIZE, n_process=PREPROCESS_PROCESSES):
+    return list(iter_preprocessed(documents, batch_size=batch_size, n_process=n_process))
+
+# Training knobs shared by the in-memory and streamed modes
+LDA_CHUNKSIZE = 100
+LDA_PASSES = 10
+# Corpora at least this large are serialized to disk and trained with LdaMulticore
+STREAMED_LDA_THRESHOLD = 10000
+LDA_WORKERS = max((os.cpu_count() or 2) - 1, 1)
+# Where streamed corpora and their models are kept
+CORPUS_DIR = os.path.join(CACHE_DIR, 'corpora')
 
-def preprocess_texts(documents):
-    stop_words = stopwords.words('english')
-    texts = []
-    for document in documents:
-        doc = nlp(document)
-        texts.append([token.lemma_ for token in doc if token.lemma_ not in stop_words and token.lemma_.isalpha()])
-    return texts
+@traced()
+def build_lda_model(documents, num_topics=5, corpus_id=None, workers=None,
+                    chunksize=LDA_CHUNKSIZE, passes=LDA_PASSES):
+    # A named corpus is updated incrementally by the topic model store, which trains
+    # large corpora with the streamed LdaMulticore path as well
+    if corpus_id is not None:
+        return topic_models.update(corpus_id, documents, num_topics=num_topics)
 
-def build_lda_model(documents, num_topics=5):
+    # Large corpora never fit comfortably in memory as a list of bags of words
+    if len(documents) >= STREAMED_LDA_THRESHOLD or workers is not None:
+        return train_lda_model_streamed(documents, num_topics=num_topics, workers=workers,
+                                        chunksize=chunksize, passes=passes)
+
+    # Identical corpora with identical settings always produce the same model
+    key = content_key('lda', documents, num_topics=num_topics, chunksize=chunksize, passes=passes)
+    return cache.get_or_compute(key, lambda: train_lda_model(documents, num_topics=num_topics,
+                                                             chunksize=chunksize, passes=passes))
+
+def train_lda_model(documents, num_topics=5, chunksize=LDA_CHUNKSIZE, passes=LDA_PASSES):
     # Preprocess documents
     texts = preprocess_texts(documents)
-    
+    return fit_lda_model(texts, num_topics=num_topics, chunksize=chunksize, passes=passes)
+
+@traced()
+def fit_lda_model(texts, num_topics=5, chunksize=LDA_CHUNKSIZE, passes=LDA_PASSES):
     # Create Dictionary
     id2word = corpora.Dictionary(texts)
     
@@ -37,13 +85,281 @@ def build_lda_model(documents, num_topics=5):
                          num_topics=num_topics, 
                          random_state=100,
                          update_every=1,
-                         chunksize=100,
-                         passes=10,
+                         chunksize=chunksize,
+                         passes=passes,
                          alpha='auto',
                          per_word_topics=True)
     
     return lda_model, id2word, texts
 
+def iter_token_file(path):
+    with open(path) as f:
+        for line in f:
+            yield json.loads(line)
+
+@traced()
+def train_lda_model_streamed(documents, num_topics=5, workers=None, chunksize=LDA_CHUNKSIZE,
+                             passes=LDA_PASSES, corpus_dir=None):
+    """Trains LdaMulticore over a memory-mapped MmCorpus instead of an in-memory list.
+
+    Preprocessed tokens are spooled to disk, the Dictionary and MmCorpus are
+    built from that file in two streaming passes, and the corpus is read back
+    lazily during training. Results live in a directory keyed by the input,
+    so the same corpus and settings are only trained once.
+    """
+    workers = workers or LDA_WORKERS
+    if corpus_dir is None:
+        key = content_key('lda_streamed', documents, num_topics=num_topics, chunksize=chunksize, passes=passes)
+        corpus_dir = os.path.join(CORPUS_DIR, key.split(':', 1)[1])
+    os.makedirs(corpus_dir, exist_ok=True)
+    model_path = os.path.join(corpus_dir, 'lda.model')
+    dictionary_path = os.path.join(corpus_dir, 'dictionary')
+    corpus_path = os.path.join(corpus_dir, 'corpus.mm')
+
+    if os.path.exists(model_path):
+        return (LdaMulticore.load(model_path), corpora.Dictionary.load(dictionary_path),
+                corpora.MmCorpus(corpus_path))
+
+    # Spool the preprocessed documents so they never all sit in memory at once
+    tokens_path = os.path.join(corpus_dir, 'tokens.jsonl')
+    with open(tokens_path, 'w') as f:
+        for text in iter_preprocessed(documents):
+            f.write(json.dumps(text) + '\n')
+
+    id2word = corpora.Dictionary(iter_token_file(tokens_path))
+    corpora.MmCorpus.serialize(corpus_path, (id2word.doc2bow(text) for text in iter_token_file(tokens_path)),
+                               id2word=id2word)
+    os.remove(tokens_path)
+    corpus = corpora.MmCorpus(corpus_path)
+
+    # LdaMulticore can't learn alpha, so it uses a symmetric prior
+    lda_model = LdaMulticore(corpus=corpus,
+                             id2word=id2word,
+                             num_topics=num_topics,
+                             random_state=100,
+                             chunksize=chunksize,
+                             passes=passes,
+                             workers=workers,
+                             per_word_topics=True)
+
+    id2word.save(dictionary_path)
+    lda_model.save(model_path)
+    return lda_model, id2word, corpus
+
+def perplexity(lda_model, corpus, total_docs=None):
+    """Per-word perplexity of ``corpus`` under ``lda_model`` (lower is better).
+
+    Pass the size of the training corpus as ``total_docs`` when scoring a
+    small batch, so the estimate is scaled the same way as the training one.
+    """
+    return float(np.exp2(-lda_model.log_perplexity(corpus, total_docs=total_docs)))
+
+# Where per-corpus topic models are persisted
+TOPIC_MODEL_DIR = os.path.join(CACHE_DIR, 'topic_models')
+# Retrain from scratch once new documents are this much more perplexing than the training corpus
+PERPLEXITY_DRIFT = 0.25
+# ... or once this fraction of the vocabulary is words the trained model has never seen
+VOCABULARY_DRIFT = 0.2
+# Stored documents checked for changes: the last few plus an even sample of the rest
+DIGEST_TAIL = 100
+DIGEST_SAMPLES = 1000
+
+def documents_digest(documents, count):
+    """Digest of the first ``count`` documents that costs the same however long the corpus is.
+
+    It covers the last ``DIGEST_TAIL`` documents, where appends happen, and
+    ``DIGEST_SAMPLES`` spread over the rest, so an edit elsewhere is only
+    caught if it falls on a sampled document.
+    """
+    stride = max(count // DIGEST_SAMPLES, 1)
+    return content_key('documents', documents[max(count - DIGEST_TAIL, 0):count] + documents[0:count:stride],
+                       count=count)
+
+class AppendedCorpus:
+    """An MmCorpus followed by the rows appended to it since, read from a JSON-lines file.
+
+    Only the first ``appended`` lines of the file count, anything after them
+    was written by an append that never recorded its state.
+    """
+
+    def __init__(self, base_path, append_path, appended=0):
+        self.base = corpora.MmCorpus(base_path)
+        self.append_path = append_path
+        self.appended = appended
+
+    def iter_appended(self):
+        if not self.appended:
+            return
+        with open(self.append_path) as f:
+            for line in itertools.islice(f, self.appended):
+                yield [tuple(pair) for pair in json.loads(line)]
+
+    def __iter__(self):
+        yield from self.base
+        yield from self.iter_appended()
+
+    def __len__(self):
+        return len(self.base) + self.appended
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        if index < len(self.base):
+            return self.base[index]
+        return next(itertools.islice(self.iter_appended(), index - len(self.base), None))
+
+class TopicModelStore:
+    """Persists the Dictionary and LdaModel of each corpus and folds new documents into them.
+
+    A corpus is identified by the caller's ``corpus_id``. When the documents
+    passed for it extend the ones already trained on, only the new documents
+    are preprocessed and folded in with ``LdaModel.update``, and their rows
+    are appended to a side file rather than rewriting the stored MmCorpus.
+    The MmCorpus is rewritten once the side file holds as many rows as it. A
+    full retrain happens when the stored documents changed (as far as
+    ``documents_digest`` can tell), the number of topics changed, or the new
+    documents drift past the perplexity or vocabulary thresholds.
+    """
+
+    def __init__(self, directory=TOPIC_MODEL_DIR, perplexity_drift=PERPLEXITY_DRIFT,
+                 vocabulary_drift=VOCABULARY_DRIFT):
+        self.directory = directory
+        self.perplexity_drift = perplexity_drift
+        self.vocabulary_drift = vocabulary_drift
+        self._lock = threading.Lock()
+
+    def _path(self, corpus_id, name):
+        corpus_dir = os.path.join(self.directory, hashlib.sha256(corpus_id.encode('utf-8')).hexdigest()[:32])
+        os.makedirs(corpus_dir, exist_ok=True)
+        return os.path.join(corpus_dir, name)
+
+    def load(self, corpus_id):
+        """Returns (state, lda_model, id2word, corpus) for a stored corpus, or None."""
+        state_path = self._path(corpus_id, 'state.json')
+        if not os.path.exists(state_path):
+            return None
+        with open(state_path) as f:
+            state = json.load(f)
+        corpus = AppendedCorpus(self._path(corpus_id, 'corpus.mm'), self._path(corpus_id, 'appended.jsonl'),
+                                state.get('appended', 0))
+        if len(corpus.base) != state.get('base_rows', len(corpus.base)):
+            # The corpus was rewritten but its state never recorded, start over
+            return None
+        lda_model = LdaModel.load(self._path(corpus_id, 'lda.model'))
+        id2word = corpora.Dictionary.load(self._path(corpus_id, 'dictionary'))
+        return state, lda_model, id2word, corpus
+
+    def _save_state(self, corpus_id, state):
+        state_path = self._path(corpus_id, 'state.json')
+        with open(state_path + '.new', 'w') as f:
+            json.dump(state, f)
+        os.replace(state_path + '.new', state_path)
+
+    def save(self, corpus_id, documents, lda_model, id2word, corpus, baseline_perplexity):
+        # Rewrite the corpus under a new name first, the old file may be the one being read
+        corpus_path = self._path(corpus_id, 'corpus.mm')
+        corpora.MmCorpus.serialize(corpus_path + '.new', corpus, id2word=id2word)
+        for suffix in ('', '.index'):
+            os.replace(corpus_path + '.new' + suffix, corpus_path + suffix)
+        lda_model.save(self._path(corpus_id, 'lda.model'))
+        id2word.save(self._path(corpus_id, 'dictionary'))
+        base = corpora.MmCorpus(corpus_path)
+        self._save_state(corpus_id, {
+            'num_topics': lda_model.num_topics,
+            'documents': len(documents),
+            'digest': documents_digest(documents, len(documents)),
+            'perplexity': baseline_perplexity,
+            'base_rows': len(base),
+            'appended': 0,
+            'appended_bytes': 0,
+        })
+        return lda_model, id2word, AppendedCorpus(corpus_path, self._path(corpus_id, 'appended.jsonl'))
+
+    def append(self, corpus_id, documents, lda_model, id2word, state, rows):
+        """Saves the updated model and adds ``rows`` after the stored corpus without rewriting it."""
+        append_path = self._path(corpus_id, 'appended.jsonl')
+        with open(append_path, 'ab') as f:
+            # Drop whatever an append that never recorded its state left behind
+            f.truncate(state.get('appended_bytes', 0))
+            f.seek(0, os.SEEK_END)
+            for row in rows:
+                f.write((json.dumps([[int(word), int(count)] for word, count in row]) + '\n').encode('utf-8'))
+            appended_bytes = f.tell()
+        lda_model.save(self._path(corpus_id, 'lda.model'))
+        state = dict(state, documents=len(documents), digest=documents_digest(documents, len(documents)),
+                     appended=state.get('appended', 0) + len(rows), appended_bytes=appended_bytes)
+        self._save_state(corpus_id, state)
+        return lda_model, id2word, AppendedCorpus(self._path(corpus_id, 'corpus.mm'), append_path,
+                                                  state['appended'])
+
+    def retrain(self, corpus_id, documents, num_topics=5):
+        if len(documents) < STREAMED_LDA_THRESHOLD:
+            lda_model, id2word, corpus = train_lda_model(documents, num_topics=num_topics)
+            return self.save(corpus_id, documents, lda_model, id2word, corpus, perplexity(lda_model, corpus))
+
+        # Large uploads train with LdaMulticore over an MmCorpus in a scratch directory, which
+        # must start empty or the previous training run would be returned as is
+        scratch_dir = self._path(corpus_id, 'streamed')
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        try:
+            lda_model, id2word, corpus = train_lda_model_streamed(documents, num_topics=num_topics,
+                                                                  corpus_dir=scratch_dir)
+            return self.save(corpus_id, documents, lda_model, id2word, corpus, perplexity(lda_model, corpus))
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    @traced()
+    def update(self, corpus_id, documents, num_topics=5):
+        """Returns (lda_model, id2word, corpus) for ``documents``, updating the stored model if possible."""
+        documents = list(documents)
+        with self._lock:
+            stored = self.load(corpus_id)
+            if stored is None:
+                return self.retrain(corpus_id, documents, num_topics)
+
+            state, lda_model, id2word, corpus = stored
+            known = state['documents']
+            if (state['num_topics'] != num_topics or len(documents) < known
+                    or documents_digest(documents, known) != state['digest']):
+                return self.retrain(corpus_id, documents, num_topics)
+            if len(documents) == known:
+                return lda_model, id2word, corpus
+
+            new_texts = preprocess_texts(documents[known:])
+            # The trained topic-word matrix has a fixed vocabulary, so the dictionary is never grown
+            # here: new words are only counted, and a retrain picks them up once there are enough
+            known_corpus = []
+            unseen = set()
+            for text in new_texts:
+                bow, missing = id2word.doc2bow(text, return_missing=True)
+                known_corpus.append([(word, count) for word, count in bow if word < lda_model.num_terms])
+                unseen.update(missing)
+
+            if len(unseen) > self.vocabulary_drift * lda_model.num_terms:
+                return self.retrain(corpus_id, documents, num_topics)
+            # A batch without a single known word has no perplexity (it would divide by zero)
+            if any(known_corpus):
+                drifted = perplexity(lda_model, known_corpus, total_docs=known)
+                if not np.isfinite(drifted) or drifted > state['perplexity'] * (1 + self.perplexity_drift):
+                    return self.retrain(corpus_id, documents, num_topics)
+                lda_model.update(known_corpus)
+            if len(corpus) + len(known_corpus) > 2 * len(corpus.base):
+                # Fold the side file into the MmCorpus once it is as long, so appends stay amortized O(1) per row
+                return self.save(corpus_id, documents, lda_model, id2word,
+                                 itertools.chain(corpus, known_corpus), state['perplexity'])
+            return self.append(corpus_id, documents, lda_model, id2word, state, known_corpus)
+
+
+topic_models = TopicModelStore()
+
+@traced()
+def topics_job(documents, num_topics=5, corpus_id=None, num_words=10, progress=None):
+    """Background job: builds the topic model and returns its topics as (id, formatted words)."""
+    lda_model, id2word, corpus = build_lda_model(documents, num_topics=num_topics, corpus_id=corpus_id)
+    return lda_model.show_topics(formatted=True, num_topics=num_topics, num_words=num_words)
+
 def display_topics(lda_model, id2word, num_words=10):
     topics = lda_model.print_topics(num_topics=-1, num_words=num_words)
     for topic in topics:
@@ -0,0 +1,187 @@
+
+# tracing.py
+
+import functools
+import inspect
+import os
+import resource
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Tracing is off unless enabled here or by Tracer.enable(), spans then cost a flag check
+TRACE_ENABLED = os.environ.get("EDU_ASSIST_TRACE", "") not in ("", "0")
+# Finished spans kept for summaries
+TRACE_HISTORY = 10000
+
+
+def current_rss():
+    """Returns the resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Not on Linux, fall back to the peak RSS which is the best we have
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Tracer:
+    """Records named spans with their wall time, CPU time and RSS change.
+
+    Spans opened inside another span on the same thread record it as their
+    parent, so a pipeline breaks down into its stages. CPU time is this
+    thread's, work done in worker processes is not included. Counts known
+    only once a stage has run are added to its span with ``annotate``.
+    Finished spans are passed to every hook registered with ``add_hook`` and
+    kept in a bounded history for ``summary``.
+    """
+
+    def __init__(self, enabled=TRACE_ENABLED, history=TRACE_HISTORY):
+        self.enabled = enabled
+        self.spans = deque(maxlen=history)
+        self.hooks = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def add_hook(self, hook):
+        """Registers ``hook(span)`` to be called with a dict for every finished span."""
+        self.hooks.append(hook)
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _record(self, span):
+        with self._lock:
+            self.spans.append(span)
+        for hook in self.hooks:
+            try:
+                hook(span)
+            except Exception as e:
+                print(f"Error in tracing hook: {e}")
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Times the enclosed block as span ``name``."""
+        if not self.enabled:
+            yield
+            return
+        stack = self._stack()
+        parent = stack[-1][0] if stack else None
+        attributes = dict(attributes)
+        stack.append((name, attributes))
+        rss_before = current_rss()
+        cpu_start = time.thread_time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            cpu = time.thread_time() - cpu_start
+            stack.pop()
+            rss = current_rss()
+            self._record(dict(attributes, name=name, parent=parent, depth=len(stack), wall_seconds=wall,
+                              cpu_seconds=cpu, rss_bytes=rss, rss_delta_bytes=rss - rss_before))
+
+    def annotate(self, **attributes):
+        """Adds ``attributes`` to the innermost span open on this thread, if any."""
+        stack = self._stack() if self.enabled else None
+        if stack:
+            stack[-1][1].update(attributes)
+
+    def traced_generator(self, name, generator):
+        # Only the time spent producing items counts, not the consumer's time between them
+        wall = cpu = 0.0
+        items = 0
+        rss_before = current_rss()
+        try:
+            while True:
+                cpu_start = time.thread_time()
+                start = time.perf_counter()
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    return
+                finally:
+                    wall += time.perf_counter() - start
+                    cpu += time.thread_time() - cpu_start
+                items += 1
+                yield item
+        finally:
+            generator.close()
+            stack = self._stack()
+            rss = current_rss()
+            self._record({"name": name, "parent": stack[-1][0] if stack else None, "depth": len(stack),
+                          "wall_seconds": wall, "cpu_seconds": cpu, "items": items, "rss_bytes": rss,
+                          "rss_delta_bytes": rss - rss_before})
+
+    def traced(self, name=None):
+        """Decorator recording a span for every call. Generators are timed across their whole iteration."""
+
+        def decorate(function):
+            span_name = name or f"{function.__module__}.{function.__qualname__}"
+            if inspect.isgeneratorfunction(function):
+                @functools.wraps(function)
+                def generator_wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return function(*args, **kwargs)
+                    return self.traced_generator(span_name, function(*args, **kwargs))
+                return generator_wrapper
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self.span(span_name):
+                    return function(*args, **kwargs)
+            return wrapper
+
+        return decorate
+
+    @contextmanager
+    def capture(self):
+        """Collects the spans finished while the block runs into the yielded list."""
+        captured = []
+        self.add_hook(captured.append)
+        try:
+            yield captured
+        finally:
+            self.hooks.remove(captured.append)
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+    def summary(self, spans=None):
+        """Totals per span name: calls, wall and CPU seconds and the largest RSS increase."""
+        totals = {}
+        for span in (self.spans if spans is None else spans):
+            total = totals.setdefault(span["name"], {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0,
+                                                     "max_rss_delta_bytes": 0})
+            total["calls"] += 1
+            total["wall_seconds"] += span["wall_seconds"]
+            total["cpu_seconds"] += span["cpu_seconds"]
+            total["max_rss_delta_bytes"] = max(total["max_rss_delta_bytes"], span["rss_delta_bytes"])
+        return totals
+
+
+# Keys every span has, anything else is an attribute of the stage
+SPAN_FIELDS = ("name", "parent", "depth", "wall_seconds", "cpu_seconds", "items", "rss_bytes", "rss_delta_bytes")
+
+
+def print_span(span):
+    """Tracing hook that prints each span and its attributes, indented by depth."""
+    attributes = "".join(f", {key}={value}" for key, value in span.items() if key not in SPAN_FIELDS)
+    print(f"{'  ' * span['depth']}{span['name']}: {span['wall_seconds']:.3f}s wall, "
+          f"{span['cpu_seconds']:.3f}s CPU, RSS {span['rss_delta_bytes'] / 2 ** 20:+.1f} MB{attributes}")
+
+
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced
+annotate = tracer.annotate
@@ -0,0 +1,290 @@
+
+# translation.py
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from langdetect import DetectorFactory, detect
+
+from result_cache import CACHE_DIR, connect, content_key
+from tracing import traced
+
+# langdetect is randomized, seeding it makes repeated detections of a text agree
+DetectorFactory.seed = 0
+
+TRANSLATION_DB = os.path.join(CACHE_DIR, "translations.sqlite3")
+# "google" uses the googletrans web service, "local" an offline MarianMT model per language pair
+TRANSLATION_BACKEND = os.environ.get("EDU_ASSIST_TRANSLATION_BACKEND", "google")
+# Characters sent per translation request, under the web service's limit of about 5,000
+BATCH_CHARS = 4500
+# Translated sentences also kept in memory per process
+MEMORY_SENTENCES = 10000
+
+# Characters langdetect sees: a few slices spread over the document are as good as all of it
+DETECT_SAMPLE_CHARS = 3000
+DETECT_SAMPLES = 3
+
+# Names shown in the app and the codes translations are stored under
+LANGUAGE_CODES = {
+    "english": "en",
+    "spanish": "es",
+    "french": "fr",
+    "german": "de",
+    "portuguese": "pt",
+}
+
+# Sentence ends, keeping the whitespace after them so the text can be put back together exactly
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])(\s+)|(\n+)")
+
+
+def language_code(language):
+    language = language.strip().lower()
+    return LANGUAGE_CODES.get(language, language)
+
+
+def split_sentences(text):
+    """Splits ``text`` into alternating sentences and the whitespace between them."""
+    pieces = [piece for piece in SENTENCE_BREAK.split(text) if piece is not None]
+    # Even positions are sentences, odd positions the separators between them
+    return pieces[0::2], pieces[1::2]
+
+
+def sample_text(text, sample_chars=DETECT_SAMPLE_CHARS, samples=DETECT_SAMPLES):
+    """Returns evenly spaced slices of ``text`` totalling about ``sample_chars`` characters."""
+    if len(text) <= sample_chars:
+        return text
+    size = sample_chars // samples
+    step = (len(text) - size) // max(samples - 1, 1)
+    return " ".join(text[start:start + size] for start in range(0, step * samples, step))
+
+
+@lru_cache(maxsize=1024)
+def detect_sample(sample):
+    return detect(sample)
+
+
+@traced()
+def detect_language(text):
+    """Detects the language of ``text`` from a sample of it, caching the answer per sample."""
+    try:
+        return detect_sample(sample_text(text))
+    except Exception as e:
+        print(f"Error detecting language: {e}")
+        return None
+
+
+class GoogleTranslateBackend:
+    """Translates through the googletrans web service.
+
+    Any object with a ``translate_batch(texts, dest)`` method returning one
+    translation per text can be used in its place, for example a local model
+    or a stub in tests. Backends raise rather than return text they could
+    not translate, and their ``name`` keeps their translations apart in the
+    translation memory.
+    """
+
+    name = "google"
+    separator = "\n"
+
+    def __init__(self):
+        from googletrans import Translator
+
+        self.translator = Translator()
+
+    def translate_batch(self, texts, dest):
+        # One request for the whole batch, one line per sentence
+        translated = self.translator.translate(self.separator.join(texts), dest=dest).text.split(self.separator)
+        if len(translated) == len(texts):
+            return translated
+        # The service merged or split lines, fall back to a request per sentence
+        return [result.text for result in self.translator.translate(list(texts), dest=dest)]
+
+
+class LocalTranslationBackend:
+    """Offline translation with the Helsinki-NLP MarianMT model of each language pair."""
+
+    name = "local"
+    model_template = "Helsinki-NLP/opus-mt-{source}-{dest}"
+
+    def __init__(self):
+        self._pipelines = {}
+        self._lock = threading.Lock()
+
+    def pipeline(self, source, dest):
+        from inference_backends import load_pipeline
+
+        with self._lock:
+            if (source, dest) not in self._pipelines:
+                try:
+                    self._pipelines[source, dest] = load_pipeline(
+                        "translation", self.model_template.format(source=source, dest=dest))
+                except Exception as e:
+                    # Not every pair has a model, remember that rather than trying again for every batch
+                    self._pipelines[source, dest] = None
+                    print(f"Error loading the {source}-{dest} translation model: {e}")
+            if self._pipelines[source, dest] is None:
+                raise ValueError(f"No translation model from '{source}' to '{dest}'")
+            return self._pipelines[source, dest]
+
+    def translate_batch(self, texts, dest):
+        source = detect_language(" ".join(texts))
+        if source is None:
+            raise ValueError("Could not detect the language to translate from")
+        if source == dest:
+            return list(texts)
+        results = self.pipeline(source, dest)(list(texts), batch_size=16, truncation=True)
+        return [result["translation_text"] for result in results]
+
+
+BACKENDS = {"google": GoogleTranslateBackend, "local": LocalTranslationBackend}
+
+
+class TranslationMemory:
+    """Sentence translations stored in SQLite, with the most recent ones also kept in memory."""
+
+    def __init__(self, db_path=TRANSLATION_DB, memory_sentences=MEMORY_SENTENCES):
+        self.db_path = db_path
+        self.memory_sentences = memory_sentences
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with connect(self.db_path) as db:
+            db.execute("CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, text TEXT NOT NULL)")
+
+    @staticmethod
+    def key(sentence, dest, backend):
+        return content_key("translation", sentence, dest=dest, backend=backend)
+
+    def _remember(self, key, text):
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_sentences:
+            self._memory.popitem(last=False)
+
+    def get_many(self, sentences, dest, backend):
+        """Returns {sentence: translation} for the sentences ``backend`` already translated to ``dest``."""
+        keys = {self.key(sentence, dest, backend): sentence for sentence in set(sentences)}
+        found = {}
+        with self._lock:
+            for key in list(keys):
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[keys.pop(key)] = self._memory[key]
+        missing = list(keys)
+        with connect(self.db_path) as db:
+            # SQLite allows 999 parameters per statement
+            for start in range(0, len(missing), 900):
+                chunk = missing[start:start + 900]
+                rows = db.execute(f"SELECT key, text FROM translations WHERE key IN ({','.join('?' * len(chunk))})",
+                                  chunk).fetchall()
+                with self._lock:
+                    for key, text in rows:
+                        self._remember(key, text)
+                        found[keys[key]] = text
+        return found
+
+    def set_many(self, translations, dest, backend):
+        rows = [(self.key(sentence, dest, backend), text) for sentence, text in translations.items()]
+        with connect(self.db_path) as db:
+            db.executemany("INSERT OR REPLACE INTO translations (key, text) VALUES (?, ?)", rows)
+        with self._lock:
+            for key, text in rows:
+                self._remember(key, text)
+
+
+class TranslationService:
+    """Translates text sentence by sentence through a translation memory.
+
+    Sentences translated before (in any text) come from the memory, the rest
+    are sent to the backend in batches of up to ``batch_chars`` characters.
+    A batch the backend fails on is left untranslated and not remembered, so
+    a later request tries it again.
+    """
+
+    def __init__(self, backend=None, memory=None, batch_chars=BATCH_CHARS):
+        self.backend = backend or BACKENDS[TRANSLATION_BACKEND]()
+        self.backend_name = getattr(self.backend, "name", type(self.backend).__name__)
+        self.memory = memory or TranslationMemory()
+        self.batch_chars = batch_chars
+        self._stats_lock = threading.Lock()
+        self.counts = {"sentences": 0, "memory_hits": 0, "translated": 0, "failed": 0, "requests": 0}
+
+    def batches(self, sentences):
+        batch, size = [], 0
+        for sentence in sentences:
+            if batch and size + len(sentence) + 1 > self.batch_chars:
+                yield batch
+                batch, size = [], 0
+            batch.append(sentence)
+            size += len(sentence) + 1
+        if batch:
+            yield batch
+
+    @traced()
+    def translate_sentences(self, sentences, dest):
+        """Returns {sentence: translation} for every distinct non-blank sentence that could be translated."""
+        dest = language_code(dest)
+        wanted = [sentence for sentence in dict.fromkeys(sentences) if sentence.strip()]
+        found = self.memory.get_many(wanted, dest, self.backend_name)
+        missing = [sentence for sentence in wanted if sentence not in found]
+        requests = failed = 0
+        for batch in self.batches(missing):
+            requests += 1
+            try:
+                translated = dict(zip(batch, self.backend.translate_batch(batch, dest)))
+            except Exception as e:
+                print(f"Error translating {len(batch)} sentences to {dest}: {e}")
+                failed += len(batch)
+                continue
+            self.memory.set_many(translated, dest, self.backend_name)
+            found.update(translated)
+        with self._stats_lock:
+            self.counts["sentences"] += len(wanted)
+            self.counts["memory_hits"] += len(wanted) - len(missing)
+            self.counts["translated"] += len(missing) - failed
+            self.counts["failed"] += failed
+            self.counts["requests"] += requests
+        return found
+
+    def translate(self, text, dest):
+        return self.translate_many([text], dest)[0]
+
+    def translate_many(self, texts, dest):
+        """Translates several texts, sharing batches and memory lookups between them."""
+        split = [split_sentences(text) for text in texts]
+        translations = self.translate_sentences([sentence for sentences, _ in split for sentence in sentences], dest)
+        results = []
+        for sentences, separators in split:
+            pieces = []
+            for index, sentence in enumerate(sentences):
+                pieces.append(translations.get(sentence, sentence))
+                if index < len(separators):
+                    pieces.append(separators[index])
+            results.append("".join(pieces))
+        return results
+
+    def stats(self):
+        with self._stats_lock:
+            counts = dict(self.counts)
+        counts["hit_rate"] = counts["memory_hits"] / counts["sentences"] if counts["sentences"] else 0.0
+        return counts
+
+
+# Shared service, created on first use so importing this module needs no network or models
+service = None
+service_lock = threading.Lock()
+
+
+def get_translation_service():
+    global service
+    with service_lock:
+        if service is None:
+            service = TranslationService()
+    return service
+
+
+def translate_text(text, dest_language):
+    return get_translation_service().translate(text, dest_language)
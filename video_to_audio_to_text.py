@@ -2,47 +2,370 @@
 # video_to_audio_to_text.py
 
 import json
+import itertools
+import os
+import re
+import struct
+import subprocess
+import threading
+import time
+import wave
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from google.oauth2 import service_account
 from google.cloud import speech
 from moviepy.editor import VideoFileClip
-import io
+import imageio_ffmpeg
 import streamlit as st
 
-# Retrieve your service account credentials from Streamlit's secrets
-gcp_service_account_info = json.loads(st.secrets["gcp_service_account"]["credentials"])
-credentials = service_account.Credentials.from_service_account_info(gcp_service_account_info)
+from rag_engine import index_document
+from result_cache import cache, content_key, hash_file
+from tracing import traced
 
-# Initialize the Google Cloud client with the credentials
-client = speech.SpeechClient(credentials=credentials)
+# Speech recognition works at 16 kHz, anything higher is just more bytes to move
+NATIVE_SAMPLE_RATE = 16000
 
-def convert_video_to_audio(video_file_path):
+# Google Cloud client, created on first use so the module imports without credentials
+client = None
+client_lock = threading.Lock()
+
+def get_client():
+    """Returns the shared Google Cloud Speech client, creating it on first use."""
+    global client
+    with client_lock:
+        if client is None:
+            # Retrieve your service account credentials from Streamlit's secrets
+            gcp_service_account_info = json.loads(st.secrets["gcp_service_account"]["credentials"])
+            credentials = service_account.Credentials.from_service_account_info(gcp_service_account_info)
+            client = speech.SpeechClient(credentials=credentials)
+    return client
+
+# A finalized piece of transcript and how far into the audio recognition has got
+PartialTranscript = namedtuple("PartialTranscript", ["text", "processed_seconds", "total_seconds"])
+
+# Transcript of one audio segment with its timing metrics
+SegmentResult = namedtuple("SegmentResult", ["index", "start_seconds", "end_seconds", "text", "seconds", "attempts"])
+
+class GoogleSpeechRecognizer:
+    """Streaming recognition backend for Google Cloud Speech-to-Text.
+
+    Any object with a ``stream(frames, sample_rate)`` generator method can be
+    used in its place, for example a local fake recognizer in tests.
+    """
+
+    # Google ends a streaming session after about five minutes of audio
+    session_seconds = 290
+    sample_rate = NATIVE_SAMPLE_RATE
+
+    def __init__(self, language_code='en-US', speech_client=None):
+        self.language_code = language_code
+        self.speech_client = speech_client
+
+    def recognition_config(self, sample_rate):
+        return speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=sample_rate,
+            language_code=self.language_code,
+            audio_channel_count=1,  # Indicate that the audio is mono
+            enable_separate_recognition_per_channel=False
+        )
+
+    def transcribe(self, audio_content, sample_rate):
+        """Transcribes a short (under one minute) LINEAR16 segment synchronously."""
+        speech_client = self.speech_client or get_client()
+        audio = speech.RecognitionAudio(content=audio_content)
+        response = speech_client.recognize(config=self.recognition_config(sample_rate), audio=audio)
+        return " ".join(result.alternatives[0].transcript for result in response.results if result.alternatives)
+
+    def stream(self, frames, sample_rate):
+        """Yields final transcripts for an iterator of raw LINEAR16 frames."""
+        speech_client = self.speech_client or get_client()
+        config = speech.StreamingRecognitionConfig(config=self.recognition_config(sample_rate))
+        requests = (speech.StreamingRecognizeRequest(audio_content=frame) for frame in frames)
+        for response in speech_client.streaming_recognize(config=config, requests=requests):
+            for result in response.results:
+                if result.is_final and result.alternatives:
+                    yield result.alternatives[0].transcript
+
+@traced()
+def convert_video_to_audio(video_file_path, sample_rate=NATIVE_SAMPLE_RATE):
     """Converts a video file to an audio file (WAV format)."""
+    key = content_key('audio', hash_file(video_file_path), sample_rate=sample_rate)
+    audio_file_path = cache.file_path(key, '.wav', 'audio')
+    if os.path.exists(audio_file_path):
+        return cache.add_file(audio_file_path)
+
     clip = VideoFileClip(video_file_path)
-    audio_file_path = video_file_path.rsplit('.', 1)[0] + '.wav'
-    # Convert to audio (mono channel)
-    clip.audio.write_audiofile(audio_file_path, codec='pcm_s16le', ffmpeg_params=["-ac", "1"])
-    return audio_file_path
+    # Convert to audio (mono channel), under the cache so the WAV counts against its size budget
+    partial = f"{audio_file_path}.{os.getpid()}.{threading.get_ident()}.part.wav"
+    clip.audio.write_audiofile(partial, fps=sample_rate, codec='pcm_s16le', ffmpeg_params=["-ac", "1"])
+    os.replace(partial, audio_file_path)
+    return cache.add_file(audio_file_path)
 
-def audio_to_text(audio_file_path):
-    """Converts audio file (WAV format) to text using Google Cloud Speech-to-Text API."""
-    with io.open(audio_file_path, 'rb') as audio_file:
-        content = audio_file.read()
-
-    audio = speech.RecognitionAudio(content=content)
-    config = speech.RecognitionConfig(
-        encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-        sample_rate_hertz=44100,  # The sample rate must match the file's sample rate
-        language_code='en-US',
-        audio_channel_count=1,  # Indicate that the audio is mono
-        enable_separate_recognition_per_channel=False 
-    )
+@traced()
+def iter_video_audio(video_file_path, sample_rate=NATIVE_SAMPLE_RATE, frame_seconds=0.1):
+    """Yields mono 16-bit PCM frames decoded by ffmpeg straight from a video, no WAV on disk."""
+    command = [imageio_ffmpeg.get_ffmpeg_exe(), '-nostdin', '-loglevel', 'error',
+               '-i', video_file_path, '-vn', '-ac', '1', '-ar', str(sample_rate),
+               '-f', 's16le', 'pipe:1']
+    frame_bytes = max(int(sample_rate * frame_seconds), 1) * 2
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            data = process.stdout.read(frame_bytes)
+            if not data:
+                break
+            yield data
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to decode audio: {process.stderr.read().decode(errors='replace')}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        process.stderr.close()
+
+@traced()
+def extract_pcm(video_file_path, sample_rate=NATIVE_SAMPLE_RATE):
+    """Decodes a video's audio track into memory, returning (samples, sample_rate).
+
+    Used by parallel transcription, which needs random access to the audio;
+    streaming transcription should use ``iter_video_audio`` instead.
+    """
+    buffer = bytearray()
+    for frame in iter_video_audio(video_file_path, sample_rate, frame_seconds=1.0):
+        buffer += frame
+    return np.frombuffer(buffer, dtype='<i2'), sample_rate
+
+def iter_audio_frames(audio_file_path, frame_seconds=0.1):
+    """Yields raw PCM frames of ``frame_seconds`` from a WAV file without loading it whole."""
+    with wave.open(audio_file_path, 'rb') as wav:
+        frames_per_chunk = max(int(wav.getframerate() * frame_seconds), 1)
+        while True:
+            data = wav.readframes(frames_per_chunk)
+            if not data:
+                break
+            yield data
+
+def audio_duration(audio_file_path):
+    """Returns the length of a WAV file in seconds."""
+    with wave.open(audio_file_path, 'rb') as wav:
+        return wav.getnframes() / wav.getframerate()
+
+@traced()
+def stream_frames_to_text(frames, sample_rate, recognizer=None, frame_seconds=0.1, total_seconds=None):
+    """Transcribes an iterator of raw PCM frames, yielding PartialTranscripts as they arrive.
+
+    Audio is sent in consecutive recognition sessions no longer than the
+    recognizer's ``session_seconds``, so memory stays bounded however long
+    the recording is.
+    """
+    recognizer = recognizer or GoogleSpeechRecognizer()
+    frames = iter(frames)
+    session_seconds = getattr(recognizer, 'session_seconds', None)
+    session_frames = max(int(session_seconds / frame_seconds), 1) if session_seconds else None
+    progress = {'samples': 0}
+
+    def session(first):
+        rest = itertools.islice(frames, session_frames - 1) if session_frames else frames
+        for frame in itertools.chain([first], rest):
+            progress['samples'] += len(frame) // 2  # 16-bit mono samples
+            yield frame
 
+    for first in frames:
+        for text in recognizer.stream(session(first), sample_rate):
+            yield PartialTranscript(text.strip(), progress['samples'] / sample_rate, total_seconds)
+
+def stream_audio_to_text(audio_file_path, recognizer=None, frame_seconds=0.1):
+    """Transcribes a WAV file frame by frame at the sample rate found in its header."""
+    with wave.open(audio_file_path, 'rb') as wav:
+        sample_rate = wav.getframerate()
+        total_seconds = wav.getnframes() / sample_rate
+    frames = iter_audio_frames(audio_file_path, frame_seconds)
+    return stream_frames_to_text(frames, sample_rate, recognizer, frame_seconds, total_seconds)
+
+def stream_video_to_text(video_file_path, recognizer=None, frame_seconds=0.1):
+    """Transcribes a video's audio piped from ffmpeg at the recognizer's native sample rate."""
+    recognizer = recognizer or GoogleSpeechRecognizer()
+    sample_rate = getattr(recognizer, 'sample_rate', NATIVE_SAMPLE_RATE)
+    frames = iter_video_audio(video_file_path, sample_rate, frame_seconds)
+    return stream_frames_to_text(frames, sample_rate, recognizer, frame_seconds)
+
+@traced()
+def load_pcm(audio_file_path):
+    """Memory-maps the samples of a 16-bit mono WAV file, returning (samples, sample_rate)."""
+    with open(audio_file_path, 'rb') as f:
+        riff, _, wave_id = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            raise ValueError(f"{audio_file_path} is not a WAV file")
+        sample_rate = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{audio_file_path} has no data chunk")
+            chunk_id, size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = f.read(size)
+                sample_rate = struct.unpack('<I', fmt[4:8])[0]
+                f.seek(size % 2, 1)
+            elif chunk_id == b'data':
+                offset = f.tell()
+                break
+            else:
+                f.seek(size + size % 2, 1)
+    samples = np.memmap(audio_file_path, dtype='<i2', mode='r', offset=offset, shape=(size // 2,))
+    return samples, sample_rate
+
+def window_energy(samples, window, block_windows=4096):
+    """RMS energy of consecutive ``window``-sample windows, computed block by block."""
+    n_windows = len(samples) // window
+    energy = np.empty(n_windows, dtype=np.float32)
+    for start in range(0, n_windows, block_windows):
+        stop = min(start + block_windows, n_windows)
+        block = np.asarray(samples[start * window:stop * window], dtype=np.float32).reshape(-1, window)
+        energy[start:stop] = np.sqrt((block ** 2).mean(axis=1))
+    return energy
+
+@traced()
+def find_segments(samples, sample_rate, max_segment_seconds=50, search_seconds=10,
+                  overlap_seconds=1.0, window_seconds=0.02):
+    """Splits audio at the quietest point before every ``max_segment_seconds``.
+
+    Returns (start, end) sample offsets. Neighbouring segments overlap by
+    ``overlap_seconds`` on each side so words cut at a boundary are heard by
+    both recognizers; ``merge_overlap`` removes the duplicates afterwards.
+    """
+    total = len(samples)
+    window = max(int(sample_rate * window_seconds), 1)
+    energy = window_energy(samples, window)
+    max_segment = int(max_segment_seconds * sample_rate)
+    search = int(search_seconds * sample_rate)
+    overlap = int(overlap_seconds * sample_rate)
+
+    cuts = [0]
+    while total - cuts[-1] > max_segment:
+        target = cuts[-1] + max_segment
+        first, last = (target - search) // window, target // window
+        quietest = first + int(np.argmin(energy[first:last])) if last > first else last
+        cuts.append(min(quietest * window + window // 2, target))
+    cuts.append(total)
+
+    return [(max(start - overlap, 0), min(end + overlap, total)) for start, end in zip(cuts, cuts[1:])]
+
+def normalize_word(word):
+    return re.sub(r'[^\w]', '', word.lower())
+
+def merge_overlap(previous_text, text, max_overlap_words=20):
+    """Drops the words at the start of ``text`` that repeat the end of ``previous_text``."""
+    previous = [normalize_word(word) for word in previous_text.split()[-max_overlap_words:]]
+    words = text.split()
+    current = [normalize_word(word) for word in words[:max_overlap_words]]
+    for size in range(min(len(previous), len(current)), 0, -1):
+        if previous[-size:] == current[:size]:
+            return " ".join(words[size:])
+    return text
+
+@traced()
+def transcribe_segment(recognizer, samples, sample_rate, index, segment, retries=3, backoff=0.5):
+    """Transcribes one segment, retrying with exponential backoff on failure."""
+    start, end = segment
+    audio_content = np.asarray(samples[start:end], dtype='<i2').tobytes()
+    began = time.perf_counter()
+    for attempt in range(1, retries + 1):
+        try:
+            text = recognizer.transcribe(audio_content, sample_rate)
+            break
+        except Exception as e:
+            if attempt == retries:
+                raise
+            print(f"Segment {index} failed on attempt {attempt}: {e}")
+            time.sleep(backoff * 2 ** (attempt - 1))
+    return SegmentResult(index, start / sample_rate, end / sample_rate, text.strip(),
+                         time.perf_counter() - began, attempt)
+
+@traced()
+def transcribe_pcm(samples, sample_rate, recognizer=None, max_workers=4, retries=3, backoff=0.5,
+                   max_segment_seconds=50, overlap_seconds=1.0):
+    """Transcribes silence-delimited segments concurrently, yielding them in order.
+
+    Each yielded SegmentResult has its overlap with the previous segment
+    already removed, so joining the texts gives the full transcript.
+    """
+    recognizer = recognizer or GoogleSpeechRecognizer()
+    segments = find_segments(samples, sample_rate, max_segment_seconds=max_segment_seconds,
+                             overlap_seconds=overlap_seconds)
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
     try:
-        response = client.recognize(config=config, audio=audio)
-        transcription = " ".join([result.alternatives[0].transcript for result in response.results])
+        # Keep a couple of segments queued per worker, so a failure or an early stop costs few paid requests
+        pending = deque()
+        remaining = enumerate(segments)
+        for index, segment in remaining:
+            pending.append(pool.submit(transcribe_segment, recognizer, samples, sample_rate, index, segment,
+                                       retries, backoff))
+            if len(pending) >= 2 * max_workers:
+                break
+        previous_text = ""
+        while pending:
+            result = pending.popleft().result()
+            following = next(remaining, None)
+            if following is not None:
+                pending.append(pool.submit(transcribe_segment, recognizer, samples, sample_rate, *following,
+                                           retries, backoff))
+            text = merge_overlap(previous_text, result.text) if previous_text else result.text
+            previous_text = result.text or previous_text
+            yield result._replace(text=text)
+    finally:
+        # Segments not started yet are dropped rather than sent after an error or GeneratorExit
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def transcribe_segments(audio_file_path, recognizer=None, **options):
+    """Parallel transcription of a WAV file, see ``transcribe_pcm``."""
+    samples, sample_rate = load_pcm(audio_file_path)
+    return transcribe_pcm(samples, sample_rate, recognizer, **options)
+
+def transcribe_video(video_file_path, recognizer=None, **options):
+    """Parallel transcription of a video's audio, decoded at the recognizer's native rate."""
+    recognizer = recognizer or GoogleSpeechRecognizer()
+    samples, sample_rate = extract_pcm(video_file_path, getattr(recognizer, 'sample_rate', NATIVE_SAMPLE_RATE))
+    return transcribe_pcm(samples, sample_rate, recognizer, **options)
+
+@traced()
+def transcription_job(video_file_path, language_code='en-US', max_workers=4, progress=None):
+    """Background job: transcribes a video's audio in parallel segments and returns the text."""
+    recognizer = GoogleSpeechRecognizer(language_code)
+    samples, sample_rate = extract_pcm(video_file_path, recognizer.sample_rate)
+    total_seconds = len(samples) / sample_rate
+    parts = []
+    for segment in transcribe_pcm(samples, sample_rate, recognizer, max_workers=max_workers):
+        parts.append(segment.text)
+        if progress and total_seconds:
+            progress(min(segment.end_seconds / total_seconds, 1.0), f"{segment.end_seconds / 60:.0f} of {total_seconds / 60:.0f} minutes")
+    text = " ".join(parts)
+    if text:
+        # Make the lecture searchable by the RAG chatbot here rather than in the page script
+        if progress:
+            progress(1.0, "indexing for the chatbot")
+        index_document(text, source=content_key('video_transcript', hash_file(video_file_path),
+                                                language_code=language_code))
+    return text
+
+@traced()
+def audio_to_text(audio_file_path, recognizer=None):
+    """Converts audio file (WAV format) to text using Google Cloud Speech-to-Text API."""
+    recognizer = recognizer or GoogleSpeechRecognizer()
+    key = content_key('transcript', hash_file(audio_file_path), recognizer=type(recognizer).__name__,
+                      language_code=getattr(recognizer, 'language_code', None))
+    transcription = cache.get(key)
+    if transcription is not None:
         return transcription
+
+    try:
+        transcription = " ".join(partial.text for partial in stream_audio_to_text(audio_file_path, recognizer))
     except Exception as e:
         return f"Could not process the audio file; {e}"
+    cache.set(key, transcription)
+    return transcription
 
 def save_text(text, output_file_path):
     """Saves transcribed text to a file."""